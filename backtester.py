@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized backtest of target weights, same accounting as the bt strategy of the notebook
+
+bt.Strategy([RunEveryNPeriods(1), SelectAll(), WeighTarget(weights), Rebalance()])
+rebalances to the target weights at every bar's price; here the same equity
+curve comes from the weights x price matrices, for many weight matrices at once.
+
+Created on Mon Oct 19 09:12:27 2026
+
+@author: Cookie
+"""
+
+import numpy as np
+import pandas as pd
+from types import SimpleNamespace
+
+from profiler import profiled
+
+
+class backtester:
+    '''
+    Backtest of target portfolio weights rebalanced at every bar
+    '''
+    def __init__(self, initial_capital = 1e6, fee = 0., integer_positions = False):
+        '''
+        Parameters
+        ----------
+        initial_capital : float
+            starting value, bt's default is 1e6
+        fee : float
+            commission as a fraction of the traded notional, i.e. bt's
+            commissions = lambda q, p: fee*abs(q)*p
+        integer_positions : Boolen
+            trade whole units only, like bt.Backtest(integer_positions = True), bt's default
+        '''
+        self.initial_capital = initial_capital
+        self.fee = fee
+        self.integer_positions = integer_positions
+
+    def run(self, weights, price):
+        '''
+        Backtest one weight matrix
+
+        Parameters
+        ----------
+        weights : pandas dataframe
+            (time x assets) target weights, set at the close of each bar,
+            missing values are flat positions
+        price : pandas dataframe
+            (time x assets) prices, e.g. price.loc[portfolio_weights.index] of the notebook
+
+        Returns
+        -------
+        pandas dataframe
+            value, price (rebased to 100 like bt's res.prices), fees and turnover of every bar
+
+        '''
+        res = self.run_batch({'value': weights}, price)
+
+        return pd.DataFrame({'value': res.value['value'], 'price': res.price['value'],
+                             'fees': res.fees['value'], 'turnover': res.turnover['value']})
+
+    @profiled('backtest', rows = 'price')
+    def run_batch(self, weights, price):
+        '''
+        Backtest many weight matrices over the same prices, e.g. one per parameter set
+
+        Parameters
+        ----------
+        weights : dictionary or numpy array
+            name -> (time x assets) weight dataframe, or a (batch x time x assets) array
+        price : pandas dataframe
+            (time x assets) prices
+
+        Returns
+        -------
+        SimpleNamespace of (time x batch) dataframes
+            value, price, fees and turnover (traded notional over value)
+
+        '''
+        if isinstance(weights, dict):
+            names = list(weights)
+            W = np.stack([weights[k].reindex(index = price.index, columns = price.columns)
+                          .to_numpy(dtype = np.float64) for k in names])
+        else:
+            W = np.asarray(weights, dtype = np.float64)
+            names = list(range(W.shape[0]))
+        W = np.nan_to_num(W)
+        P = price.to_numpy(dtype = np.float64)
+
+        if self.fee == 0 and not self.integer_positions:
+            value, fees, turnover = self._frictionless(W, P)
+        else:
+            value, fees, turnover = self._positions(W, P)
+
+        frame = lambda a: pd.DataFrame(a.T, index = price.index, columns = names)
+
+        return SimpleNamespace(value = frame(value), price = frame(100 * value / self.initial_capital),
+                               fees = frame(fees), turnover = frame(turnover))
+
+    def _frictionless(self, W, P):
+        '''
+        No fees, fractional units: the value compounds the weighted returns
+        and the turnover is the gap between the targets and the drifted weights
+        '''
+        R = np.zeros_like(P)
+        R[1:] = P[1:] / P[:-1] - 1
+        R = np.nan_to_num(R)
+
+        growth = np.ones(W.shape[:2])
+        growth[:, 1:] = 1 + (W[:, :-1] * R[1:]).sum(axis = 2)
+        value = self.initial_capital * np.cumprod(growth, axis = 1)
+
+        drift = np.zeros_like(W)
+        drift[:, 1:] = W[:, :-1] * (1 + R[1:]) / growth[:, 1:, None]
+        turnover = np.abs(W - drift).sum(axis = 2)
+
+        return value, np.zeros_like(value), turnover
+
+    def _positions(self, W, P):
+        '''
+        Fees or whole units: bar by bar over the positions of every batch member,
+        following bt's Security.allocate. Buys spend d = target - holding including
+        the commission, x(1 + fee) = d, sells raise it, x(1 - fee) = d. With whole
+        units, d/price rounded towards the current side only decides whether
+        there is a trade (not when it rounds to 0) or a close (when it rounds to
+        minus the position); otherwise bt's root search ends at floor(x/price).
+        A zero target always closes the position.
+        '''
+        B, T, n = W.shape
+        P = np.nan_to_num(P)
+        pos = np.zeros((B, n))
+        cash = np.full(B, float(self.initial_capital))
+        value, fees, turnover = np.empty((B, T)), np.empty((B, T)), np.empty((B, T))
+
+        for t in range(T):
+            p = P[t]
+            V = cash + pos @ p
+            d = W[:, t] * V[:, None] - pos * p
+            x = np.where(d > 0, d / (1 + self.fee), d / (1 - self.fee))
+            q = np.divide(x, p, out = np.zeros_like(x), where = p != 0)
+            if self.integer_positions:
+                up = (pos > 0) | ((pos == 0) & (d > 0))
+                q0 = np.divide(d, p, out = np.zeros_like(d), where = p != 0)
+                q0 = np.where(up, np.floor(q0), np.ceil(q0))
+                q = np.where(q0 == 0, 0, np.where(q0 == -pos, q0, np.floor(q)))
+            q = np.where(W[:, t] == 0, -pos, q)
+
+            traded = np.abs(q) * p
+            fee = self.fee * traded.sum(axis = 1)
+            cash -= q @ p + fee
+            pos += q
+
+            value[:, t] = cash + pos @ p
+            fees[:, t] = fee
+            turnover[:, t] = traded.sum(axis = 1) / V
+
+        return value, fees, turnover
+
+    def stats(self, value, periods = None):
+        '''
+        Summary of equity curves
+
+        Parameters
+        ----------
+        value : pandas dataframe or series
+            equity curves, e.g. run_batch(...).value
+        periods : int
+            bars per year, default: inferred from the index spacing
+
+        Returns
+        -------
+        pandas dataframe
+            total return, CAGR, annualized volatility, Sharpe ratio (zero rate) and max drawdown
+
+        '''
+        value = value.to_frame() if isinstance(value, pd.Series) else value
+        if periods is None:
+            periods = pd.Timedelta('365D') / pd.Series(value.index).diff().median()
+        r = value.pct_change().iloc[1:]
+        years = (value.index[-1] - value.index[0]) / pd.Timedelta('365D')
+
+        return pd.DataFrame({'total_return': value.iloc[-1] / value.iloc[0] - 1,
+                             'cagr': (value.iloc[-1] / value.iloc[0])**(1 / years) - 1,
+                             'volatility': r.std() * np.sqrt(periods),
+                             'sharpe': r.mean() / r.std() * np.sqrt(periods),
+                             'max_drawdown': (value / value.cummax() - 1).min()})
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the hot paths of the pipeline
+
+Run all of them with `python benchmarks.py`, or call a single bench_* function.
+
+Created on Sun Oct 18 10:12:41 2026
+
+@author: Cookie
+"""
+
+import os
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+
+from data_sampler import data_manager
+from feature_engineering import Indicators
+from online_indicators import OnlineIndicators
+from random_forest import random_forest, compiled_forest
+from portfolio_optimizer import portfolio_optimizer
+from backtester import backtester
+
+# indicator set of the backtest notebook
+PARAMS = {'ADX': {'window': 10}, 'CCI': {'window': 10}, 'MACD': {'fast': 12, 'slow': 26, 'signal': 9},
+          'MOM': {'window': 5}, 'RSI': {'window': 10}, 'WILLR': {'window': 10}, 'OBV': {},
+          'Regression': {'window': 10}, 'Volatility': {'window': 5, 'nbdev': 1}}
+
+
+def synthetic_panel(n_pairs = 7, years = 3, seed = 0):
+    '''
+    Hourly OHLCV panel shaped like data_manager.readPair output
+
+    Parameters
+    ----------
+    n_pairs : int
+        number of pairs
+    years : float
+        length of the hourly history
+    seed : int
+        random seed
+
+    Returns
+    -------
+    pandas dataframe
+        (pair, date) MultiIndex with open/high/low/close/volume columns
+
+    '''
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range('2018-01-01', periods = int(24*365*years), freq = 'h')
+    panel = {}
+    for k in range(n_pairs):
+        close = 100*np.exp(np.cumsum(rng.normal(0, .01, len(idx))))
+        op = close*np.exp(rng.normal(0, .002, len(idx)))
+        high = np.maximum(op, close)*np.exp(np.abs(rng.normal(0, .003, len(idx))))
+        low = np.minimum(op, close)*np.exp(-np.abs(rng.normal(0, .003, len(idx))))
+        panel[f'P{k:02d}USD'] = pd.DataFrame({'open': op, 'high': high, 'low': low, 'close': close,
+                                              'volume': rng.lognormal(3, 1, len(idx))}, index = idx)
+
+    return pd.concat(panel, axis = 0)
+
+
+def write_gemini_csvs(data, datadir):
+    '''
+    Write a synthetic panel as Gemini_{pair}_1h.csv files, newest bar first
+    '''
+    for pair in data.index.get_level_values(0).unique():
+        df = data.loc[pair].rename(columns = {'volume': f'Volume {pair[:-3]}'})
+        df.insert(0, 'symbol', f'{pair[:-3]}/USD')
+        df.index.name = 'date'
+        df = df.reset_index()
+        df.insert(0, 'unix', df['date'].values.astype('datetime64[ms]').view('i8'))
+        with open(os.path.join(datadir, f"Gemini_{pair}_1h.csv"), 'w') as f:
+            f.write('https://www.CryptoDataDownload.com\n')
+            df.iloc[::-1].to_csv(f, index = False)
+
+
+def _timeit(func, *args, repeat = 3, **kwargs):
+    '''Best wall time over a few runs, and the last result'''
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+
+    return best, res
+
+
+def _legacy_getTEvents(gRaw, h):
+    '''The original label-based CUSUM loop, kept as the reference'''
+    tEvents,sPos,sNeg=[],0,0
+    diff=gRaw.diff()
+
+    for i in diff.index[1:]:
+        sPos,sNeg=max(0,sPos+diff.loc[i]),min(0,sNeg+diff.loc[i])
+
+        if sNeg<-h:
+            sNeg=0
+            tEvents.append(i)
+        elif sPos>h:
+            sPos=0
+            tEvents.append(i)
+
+    return pd.DatetimeIndex(tEvents)
+
+
+def bench_cusum(n_pairs = 7, years = 3, h = .02):
+    '''
+    Legacy per-ticker loop against the batched CUSUM kernel in cusumFilter
+    '''
+    data = synthetic_panel(n_pairs, years)
+    r = data.reset_index(level=0).pivot(columns='level_0', values='close').pct_change().dropna()
+    dm = data_manager()
+
+    t_legacy, legacy = _timeit(lambda: {c: _legacy_getTEvents(r[c], h) for c in r.columns}, repeat = 1)
+    dm.cusumFilter(r.iloc[:100], h)      # warm up the jit, if any
+    t_batch, batch = _timeit(dm.cusumFilter, r, h)
+    assert all(legacy[c].equals(batch[c]) for c in r.columns), 'CUSUM events differ'
+
+    print(f'cusumFilter {n_pairs} pairs x {r.shape[0]} bars: '
+          f'legacy {t_legacy:.3f}s, batched {t_batch:.4f}s, x{t_legacy/t_batch:.0f}')
+
+    return {'legacy': t_legacy, 'batched': t_batch}
+
+
+def bench_readpair(pair_counts = (2, 4, 8, 16), workers = (1, 2, 4, 8), years = 2, executor = 'process'):
+    '''
+    Scaling of readPair with the number of pairs and of workers,
+    csv parsing only (cache = False)
+    '''
+    data = synthetic_panel(max(pair_counts), years)
+    pairs = list(data.index.get_level_values(0).unique())
+    res = {}
+    print(f'readPair {years}y hourly csv, {executor} pool, {os.cpu_count()} cores')
+    with tempfile.TemporaryDirectory() as datadir:
+        write_gemini_csvs(data, datadir)
+        dm = data_manager(datadir, cache = False)
+        for n in pair_counts:
+            for w in workers:
+                res[n, w], _ = _timeit(dm.readPair, ' '.join(pairs[:n]), '2018-01-01', '2030-01-01',
+                                       workers = w, executor = executor, repeat = 1)
+            print(f'{n:3d} pairs: ' + ', '.join(f'{w} workers {res[n, w]:.2f}s' for w in workers))
+
+    return res
+
+
+def bench_pool(years = 3, params = PARAMS):
+    '''
+    Column-by-column Indicators.pool against the batched array engine
+    '''
+    data = synthetic_panel(1, years).droplevel(0)
+    ind = Indicators()
+
+    t_loop, loop = _timeit(ind.pool, data, params, engine = 'loop', repeat = 5)
+    t_batch, batch = _timeit(ind.pool, data, params, engine = 'batch', repeat = 5)
+    pd.testing.assert_frame_equal(loop.astype(np.float64), batch)
+
+    print(f'Indicators.pool {len(params)} indicators x {data.shape[0]} bars: '
+          f'loop {t_loop*1e3:.1f}ms, batch {t_batch*1e3:.1f}ms, x{t_loop/t_batch:.1f}')
+
+    return {'loop': t_loop, 'batch': t_batch}
+
+
+def bench_online(years = 1, params = None, gap = 24):
+    '''
+    Bar-by-bar OnlineIndicators replay against Indicators.pool, which it must match bit for bit,
+    params default to PARAMS plus NATR
+    '''
+    params = {**PARAMS, 'ATR': {'window': 14}} if params is None else params
+    data = synthetic_panel(1, years).droplevel(0)
+    # leading NaN bars, TA-Lib starts after them
+    data.iloc[:gap] = np.nan
+    online = OnlineIndicators(params)
+
+    t_batch, batch = _timeit(Indicators().pool, data, params, repeat = 5)
+    t_online, replay = _timeit(online.replay, data, repeat = 1)
+    pd.testing.assert_frame_equal(replay, batch.astype(np.float64), check_exact = True)
+
+    print(f'OnlineIndicators {len(params)} indicators x {data.shape[0]} bars: '
+          f'{t_online/data.shape[0]*1e6:.1f}us/bar, batch pool {t_batch*1e3:.1f}ms')
+
+    return {'per_bar': t_online/data.shape[0], 'batch': t_batch}
+
+
+def synthetic_features(n = 20000, k = 9, seed = 0):
+    '''
+    Indicator-like features with a weak, slowly drifting link to the next return
+    '''
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2018-01-01', periods = n, freq = 'h')
+    X = pd.DataFrame(rng.normal(size = (n, k)), index = index, columns = [f'f{i}' for i in range(k)])
+    drift = np.linspace(.5, 1.5, n)
+    y = pd.Series(.01*(drift*np.tanh(X['f0']) - .5*X['f1']*X['f2']) + .01*rng.normal(size = n),
+                  index = index, name = 'Return')
+
+    return X, y
+
+
+def bench_incremental_rf(n = 20000, window = 1000, train = 8, test = 1, n_estimators = 80, tolerance = 0.02):
+    '''
+    Full refit per walk-forward step against the incremental tree pool
+
+    The incremental out-of-sample R2 must stay within `tolerance` (absolute)
+    of the full refit's, 0.377 against 0.384 with the defaults.
+    '''
+    X, y = synthetic_features(n)
+    RF = random_forest()
+    steps = int(np.ceil((n - train*window) / (test*window)))
+
+    t_full, full = _timeit(RF.rolling_RF, X, y, window, train, test, n_estimators = n_estimators,
+                           random_state = 0, repeat = 1)
+    t_inc, inc = _timeit(RF.rolling_RF, X, y, window, train, test, incremental = True,
+                         n_estimators = n_estimators, random_state = 0, repeat = 1)
+
+    score = lambda pred: 1 - ((y.loc[pred.index] - pred)**2).sum() / ((y.loc[pred.index] - y.loc[pred.index].mean())**2).sum()
+    print(f'rolling_RF {steps} steps: full refit {t_full/steps*1e3:.0f}ms/step R2 {score(full):.4f}, '
+          f'incremental {t_inc/steps*1e3:.0f}ms/step R2 {score(inc):.4f}, '
+          f'corr {np.corrcoef(full, inc)[0, 1]:.3f}')
+    assert score(full) - score(inc) <= tolerance, 'incremental R2 out of tolerance'
+
+    return {'full': t_full/steps, 'incremental': t_inc/steps, 'r2_full': score(full), 'r2_incremental': score(inc)}
+
+
+def bench_inference(n = 20000, n_pairs = 7, hours = 2000, n_estimators = 100):
+    '''
+    sklearn predict + pivot against compiled_forest, for one bar and for a batch
+    '''
+    X, y = synthetic_features(n)
+    model = random_forest().one_fold_RF(X, y, n_estimators = n_estimators, random_state = 0)
+    forest = compiled_forest(model)
+
+    row = X.iloc[-1:]
+    t_row_sk, _ = _timeit(model.predict, row, repeat = 20)
+    t_row_cf, _ = _timeit(forest.predict, row, repeat = 20)
+
+    panel = pd.concat({f'P{k:02d}USD': X.iloc[k*hours:(k + 1)*hours].set_axis(X.index[:hours])
+                       for k in range(n_pairs)})
+    sk = lambda: pd.DataFrame(model.predict(panel), index = panel.index, columns = ['Predict_Return']) \
+        .reset_index(level = 0).pivot(columns = 'level_0', values = 'Predict_Return')
+    t_batch_sk, ref = _timeit(sk)
+    t_batch_cf, got = _timeit(forest.predict_panel, panel)
+    np.testing.assert_array_equal(ref.to_numpy(), got.to_numpy())
+
+    print(f'forest inference {n_estimators} trees: one bar sklearn {t_row_sk*1e3:.2f}ms, compiled {t_row_cf*1e3:.2f}ms; '
+          f'{n_pairs} pairs x {hours} bars sklearn {t_batch_sk*1e3:.0f}ms, compiled {t_batch_cf*1e3:.0f}ms')
+
+    return {'row_sklearn': t_row_sk, 'row_compiled': t_row_cf, 'batch_sklearn': t_batch_sk, 'batch_compiled': t_batch_cf}
+
+
+def weekly_covariances(n_pairs = 7, years = 1):
+    '''
+    getCovMat of every weekly window of hourly returns, as in the backtest notebook
+    '''
+    data = synthetic_panel(n_pairs, years)
+    r = data.reset_index(level=0).pivot(columns='level_0', values='close').pct_change().dropna()
+    opt = portfolio_optimizer()
+
+    return np.stack([opt.getCovMat(x) for _, x in r.resample('W') if x.shape[0] > 1])
+
+
+def bench_mvp(n_pairs = 7, years = 1):
+    '''
+    A new CVXPY problem per rebalance, the compiled warm-started one
+    and the NumPy active-set solver
+    '''
+    covs = weekly_covariances(n_pairs, years)
+    res, weights = {}, {}
+    for solver in ['cvxpy', 'parametric', 'active_set']:
+        opt = portfolio_optimizer(solver = solver)
+        opt.mvp(covs[0])       # compile, if any
+        t, weights[solver] = _timeit(opt.mvp_batch, covs, repeat = 1)
+        res[solver] = t / len(covs)
+
+    print(f'mvp {len(covs)} weekly rebalances x {n_pairs} pairs: ' +
+          ', '.join(f'{solver} {t*1e3:.2f}ms/solve' for solver, t in res.items()) +
+          f', max weight diff {max(np.abs(w - weights["cvxpy"]).max() for w in weights.values()):.1e}')
+
+    return res
+
+
+def bench_cov(n_pairs = 7, years = 3, window = 168):
+    '''
+    getCovMat per window against getCovPath, for weekly buckets and for a
+    rolling window at every bar
+    '''
+    data = synthetic_panel(n_pairs, years)
+    r = data.reset_index(level=0).pivot(columns='level_0', values='close').pct_change().dropna()
+    opt = portfolio_optimizer()
+
+    t_loop, _ = _timeit(lambda: [opt.getCovMat(x) for _, x in r.resample('W') if x.shape[0] > 1], repeat = 1)
+    t_path, _ = _timeit(opt.getCovPath, r, freq = 'W')
+    sample = r.index[window::50]
+    t_roll, _ = _timeit(lambda: [opt.getCovMat(r.loc[:d].iloc[-window:]) for d in sample], repeat = 1)
+    t_rpath, _ = _timeit(opt.getCovPath, r, window = window)
+
+    print(f'covariances {n_pairs} pairs x {r.shape[0]} bars: weekly getCovMat {t_loop*1e3:.0f}ms, '
+          f'getCovPath {t_path*1e3:.0f}ms; rolling {window} at every bar getCovMat ~{t_roll*50:.1f}s, '
+          f'getCovPath {t_rpath*1e3:.0f}ms')
+
+    return {'weekly_loop': t_loop, 'weekly_path': t_path, 'rolling_loop': t_roll*50, 'rolling_path': t_rpath}
+
+
+def bench_backtest(n_pairs = 7, months = 3, batch = 32, fee = .001):
+    '''
+    One bt run against the vectorized backtester, for a single weight matrix
+    and for a batch of them (bt is skipped when it is not installed)
+    '''
+    data = synthetic_panel(n_pairs, months / 12)
+    price = data.reset_index(level=0).pivot(columns='level_0', values='close')
+    rng = np.random.default_rng(0)
+    weights = {k: pd.DataFrame(rng.dirichlet(np.ones(n_pairs), price.shape[0]) * rng.choice([-1, 0, 1], price.shape),
+                               index = price.index, columns = price.columns) for k in range(batch)}
+    engine = backtester(fee = fee, integer_positions = True)
+
+    t_one, res = _timeit(engine.run, weights[0], price)
+    t_batch, _ = _timeit(engine.run_batch, weights, price)
+    t_free, _ = _timeit(backtester().run_batch, weights, price)
+    out = {'vectorized': t_one, 'batch': t_batch, 'batch_frictionless': t_free}
+    msg = (f'backtest {n_pairs} pairs x {price.shape[0]} bars: vectorized {t_one*1e3:.0f}ms, '
+           f'{batch} weight sets {t_batch*1e3:.0f}ms ({t_free*1e3:.0f}ms frictionless)')
+    try:
+        import bt
+        s = bt.Strategy('s', [bt.algos.RunEveryNPeriods(1), bt.algos.SelectAll(),
+                              bt.algos.WeighTarget(weights[0]), bt.algos.Rebalance()])
+        test = bt.Backtest(s, price, commissions = lambda q, p: fee*abs(q)*p, progress_bar = False)
+        out['bt'], _ = _timeit(bt.run, test, repeat = 1)
+        diff = np.abs(test.strategy.data['value'].loc[price.index] / res['value'] - 1).max()
+        msg += f'; bt {out["bt"]:.1f}s per run, max value diff {diff:.1e}'
+    except ImportError:
+        pass
+    print(msg)
+
+    return out
+
+
+if __name__ == '__main__':
+    bench_cusum()
+    bench_readpair()
+    bench_pool()
+    bench_online()
+    bench_incremental_rf()
+    bench_inference()
+    bench_mvp()
+    bench_cov()
+    bench_backtest()
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Optional numba compilation and pool selection shared by the modules
+
+njit is None without numba, or when NUMBA_DISABLE_JIT is set, and every kernel
+then runs on its plain Python or NumPy fallback.
+
+Created on Tue Oct 20 09:12:44 2026
+
+@author: Cookie
+"""
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    from numba import njit, config as numba_config
+    if numba_config.DISABLE_JIT:
+        # the kernels would run as Python loops over numpy arrays, slower than the fallbacks
+        njit = None
+except ImportError:
+    # numba is optional
+    njit = None
+
+
+def kernel_input(values):
+    '''Plain lists index much faster than numpy arrays in pure Python'''
+    return values if njit is not None else values.tolist()
+
+
+def executor_class(executor):
+    '''Pool class of an executor name, thread or process'''
+    assert executor in ('thread', 'process'), 'executor must be thread or process.'
+
+    return ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
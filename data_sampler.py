@@ -1,135 +1,599 @@
-# -*- coding: utf-8 -*-
-"""
-Data Management and Sampling features
-
-Created on Thu Aug  4 20:30:29 2022
-
-@author: Cookie
-"""
-
-import pandas as pd
-import numpy as np
-import os
-
-class data_manager:
-    '''
-    A class for data management
-    '''
-    def __init__(self, datadir = r"D:\Career\Quant\My_Research\Markov_Switching_Portfolio\cryptodatadownload"):
-        # hourly crypto data dirctory
-        self.datadir = datadir
-        
-    def readPair(self, pairs, start, end, fields = ['open', 'high', 'low', 'close', 'volume']):
-        '''
-        Read the pairs data
-
-        Parameters
-        ----------
-        pairs : str
-            A string contains all the pairs.
-        start: str
-            start date
-        end: str
-            end date
-
-        Returns
-        -------
-        pairs_df: pandas dataframe
-            all data groupby pairs' names
-
-        '''
-        pairs_list = pairs.split(' ')
-        pairs_df = {}
-        
-        for pair in pairs_list:
-            pairs_df[pair] = pd.read_csv(os.path.join(self.datadir, f"Gemini_{pair}_1h.csv"),
-                                         skiprows = 1, index_col = 1, parse_dates = True)
-            pairs_df[pair].sort_index(inplace = True)
-            pairs_df[pair] = pairs_df[pair].loc[start:end]
-            if 'volume' in fields:
-                pairs_df[pair] = pairs_df[pair].rename(columns = {f'Volume {pair[:-3]}': 'volume'})
-            pairs_df[pair] = pairs_df[pair][fields]
-            
-        pairs_df = pd.concat(pairs_df, axis = 0)
-        print('Pairs: ', pairs_list)
-        
-        return pairs_df
-    
-    def cusumFilter(self, r, h):
-        '''
-        Cusum Filter for sampling data points
-        
-        Reference:
-        [1] APA. Lopez de Prado, M. (2018). Advances in financial machine learning, 38-40
-        [2] Lam, K. and H. Yam (1997): “CUSUM techniques for technical trading in financial markets.” 
-            Financial Engineering and the Japanese Markets, Vol. 4, pp. 257–274
-
-        Parameters
-        ----------
-        data : pandas series or dataframe
-            price used in calculating returns for all assets
-        h:
-            threshold for 
-
-        Returns
-        -------
-        samples: dictionary of pandas index
-            contains index of all the sample data points for all assets
-
-        '''
-        
-        # r = data.pct_change().iloc[1:]
-        
-        samples = {}
-        
-        for ticker in r.columns:
-            idx = self.getTEvents(r[ticker], h)
-            samples[ticker] = pd.DatetimeIndex(idx)
-            
-        return samples
-        
-        
-    def getTEvents(self, gRaw, h):
-        '''
-        Cusum Filter for single time-series
-        
-        see:
-            APA. Lopez de Prado, M. (2018). Advances in financial machine learning, Page 39
-
-        Parameters
-        ----------
-        gRaw : pandas series
-            raw return series
-        h : float
-            threshold for sampling
-
-        Returns
-        -------
-        list of index of the events
-
-        '''
-        tEvents,sPos,sNeg=[],0,0
-        diff=gRaw.diff()
-        
-        for i in diff.index[1:]:
-            sPos,sNeg=max(0,sPos+diff.loc[i]),min(0,sNeg+diff.loc[i])
-        
-            if sNeg<-h:
-                sNeg=0
-                tEvents.append(i)
-            elif sPos>h:
-                sPos=0
-                tEvents.append(i)
-            
-        return pd.DatetimeIndex(tEvents)
-        
-
-
-"""For debug
-if __name__ == '__main__':
-    data = data_manager().readPair(pairs = "BTCUSD ETHUSD BATUSD FILUSD MKRUSD UNIUSD ZRXUSD",
-                               start='2020-11-01', end='2021-12-31')
-    btc_close = data.loc['BTCUSD'].close.to_frame(name = 'BTCUSD')
-    cusum = data_manager().cusumFilter(btc_close, .01)
-    print(cusum['BTCUSD'], btc_close.head(10).pct_change())
+# -*- coding: utf-8 -*-
+"""
+Data Management and Sampling features
+
+Created on Thu Aug  4 20:30:29 2022
+
+@author: Cookie
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import hashlib
+
+from profiler import profiled
+# without numba the kernels below run as plain Python loops
+from compute import njit, kernel_input, executor_class
+
+try:
+    from pyarrow import feather
+except ImportError:
+    # pyarrow is optional, without it readPair always parses the csv files
+    feather = None
+
+
+def _cusum(diff, h, sPos, sNeg):
+    '''
+    CUSUM kernel on a raw sequence of return differences
+
+    Parameters
+    ----------
+    diff : numpy array or list
+        first differences of the raw return series (without the leading NaN)
+    h : float
+        threshold for sampling
+    sPos, sNeg : float
+        running positive / negative cumulative sums to start from
+
+    Returns
+    -------
+    events: numpy array of bool
+        True where an event is sampled
+    sPos, sNeg: float
+        cumulative sums after the last observation
+
+    '''
+    events = np.zeros(len(diff), dtype = np.bool_)
+    for i in range(len(diff)):
+        d = diff[i]
+        if d != d:
+            # NaN resets both sums, same as max(0, nan) / min(0, nan)
+            sPos, sNeg = 0., 0.
+            continue
+        sPos, sNeg = max(0., sPos + d), min(0., sNeg + d)
+
+        if sNeg < -h:
+            sNeg = 0.
+            events[i] = True
+        elif sPos > h:
+            sPos = 0.
+            events[i] = True
+
+    return events, sPos, sNeg
+
+
+def _cusum_columns(cols, h, sPos, sNeg):
+    '''
+    Run the CUSUM kernel over every column of a panel in one call,
+    sPos and sNeg are updated in place
+    '''
+    events = np.zeros((len(cols), len(cols[0])), dtype = np.bool_)
+    for j in range(len(cols)):
+        events_j, sPos_j, sNeg_j = _cusum(cols[j], h, sPos[j], sNeg[j])
+        events[j] = events_j
+        sPos[j] = sPos_j
+        sNeg[j] = sNeg_j
+
+    return events
+
+
+if njit is not None:
+    _cusum = njit(cache = True)(_cusum)
+    _cusum_columns = njit(cache = True)(_cusum_columns)
+
+
+def _readPairTask(args):
+    '''
+    Worker for concurrent readPair, builds a bare data_manager so that
+    nothing but the paths is sent to process workers
+    '''
+    datadir, cachedir, cache, pair, start, end, fields = args
+    
+    return data_manager(datadir, cachedir, cache)._readOne(pair, start, end, fields)
+
+
+class data_manager:
+    '''
+    A class for data management
+    '''
+    def __init__(self, datadir = r"D:\Career\Quant\My_Research\Markov_Switching_Portfolio\cryptodatadownload",
+                 cachedir = None, cache = True):
+        # hourly crypto data dirctory
+        self.datadir = datadir
+        # columnar cache of the parsed csv files, next to the data by default
+        self.cachedir = cachedir if cachedir is not None else os.path.join(datadir, '.cache')
+        self.cache = cache and feather is not None
+        # live panel and per-pair CUSUM state, set up by stream()
+        self.panel = None
+        self.h = None
+        self.cusum_state = {}
+        self._cacheEnd = {}
+        
+    @profiled('readPair', rows = lambda out: out.bars if isinstance(out, pair_panel) else len(out))
+    def readPair(self, pairs, start, end, fields = ['open', 'high', 'low', 'close', 'volume'], panel = False,
+                 workers = None, executor = 'thread'):
+        '''
+        Read the pairs data
+
+        Parameters
+        ----------
+        pairs : str
+            A string contains all the pairs.
+        start: str
+            start date
+        end: str
+            end date
+        panel: Boolen
+            whether to return a wide pair_panel instead of the long dataframe
+        workers: int
+            number of pairs read concurrently, None or 1 reads them one by one
+        executor: str
+            'thread' or 'process' pool for the concurrent reads
+
+        Returns
+        -------
+        pairs_df: pandas dataframe or pair_panel
+            all data groupby pairs' names
+
+        '''
+        pairs_list = pairs.split(' ')
+        pairs_df = {}
+        
+        if workers is None or workers <= 1 or len(pairs_list) == 1:
+            for pair in pairs_list:
+                pairs_df[pair] = self._readOne(pair, start, end, fields)
+        else:
+            pool = executor_class(executor)
+            args = [(self.datadir, self.cachedir, self.cache, pair, start, end, fields) for pair in pairs_list]
+            with pool(max_workers = min(workers, len(pairs_list))) as ex:
+                # map keeps the order of pairs_list, whichever read finishes first
+                for pair, df in zip(pairs_list, ex.map(_readPairTask, args)):
+                    pairs_df[pair] = df
+            
+        if panel:
+            print('Pairs: ', pairs_list)
+            return pair_panel.from_frames(pairs_df, fields)
+        
+        pairs_df = pd.concat(pairs_df, axis = 0)
+        print('Pairs: ', pairs_list)
+        
+        return pairs_df
+    
+    @profiled('readPair.pair', asset = 'pair')
+    def _readOne(self, pair, start, end, fields):
+        '''
+        Read, parse and slice one pair
+        '''
+        if self.cache:
+            return self._readCached(pair, start, end, fields)
+        
+        return self._readCSV(pair, fields).loc[start:end]
+    
+    def _csvPath(self, pair):
+        return os.path.join(self.datadir, f"Gemini_{pair}_1h.csv")
+    
+    def _readCSV(self, pair, fields):
+        '''
+        Parse the full history of one pair from its csv file, sorted by date
+        '''
+        df = pd.read_csv(self._csvPath(pair), skiprows = 1, index_col = 1, parse_dates = True)
+        df.sort_index(inplace = True)
+        if 'volume' in fields:
+            df = df.rename(columns = {f'Volume {pair[:-3]}': 'volume'})
+            
+        return df[fields]
+    
+    def _cachePath(self, pair, fields):
+        '''
+        Cache file of a pair, keyed on the selected fields, the source path and its mtime
+        '''
+        src = os.path.abspath(self._csvPath(pair))
+        fields_key = hashlib.sha1(','.join(fields).encode()).hexdigest()[:8]
+        src_key = hashlib.sha1(f"{src}|{os.stat(src).st_mtime_ns}".encode()).hexdigest()[:12]
+        
+        return os.path.join(self.cachedir, f"{pair}_{fields_key}_{src_key}.feather")
+    
+    def _writeCache(self, pair, fields, path):
+        '''
+        Parse the csv once and store it as an uncompressed feather file,
+        stale versions of the same cache entry are removed
+        '''
+        os.makedirs(self.cachedir, exist_ok = True)
+        stale = os.path.basename(path).rsplit('_', 1)[0] + '_'
+        for f in os.listdir(self.cachedir):
+            if f.startswith(stale) and f.endswith(('.feather', '.append')):
+                os.remove(os.path.join(self.cachedir, f))
+                
+        tmp = f"{path}.{os.getpid()}.tmp"
+        # uncompressed so that reads can be memory-mapped without copies
+        feather.write_feather(self._readCSV(pair, fields).reset_index(), tmp, compression = 'uncompressed')
+        os.replace(tmp, path)
+    
+    def _readCached(self, pair, start, end, fields):
+        '''
+        Read one pair through the cache, only the rows in [start, end] are converted
+        '''
+        path = self._cachePath(pair, fields)
+        if not os.path.exists(path):
+            self._writeCache(pair, fields, path)
+            
+        table = feather.read_table(path, memory_map = True)
+        dates = table.column('date').to_numpy()
+        # same partial-string slicing as .loc[start:end] on the full history
+        i0, i1 = pd.DatetimeIndex(dates).slice_locs(start, end)
+        df = table.slice(i0, i1 - i0).to_pandas().set_index('date')
+        
+        appended = self._readAppended(path, fields)
+        if appended is not None:
+            # appended bars are all newer than the feather file, so slicing
+            # both pieces separately is the same as slicing their concatenation
+            appended.index = appended.index.astype(df.index.dtype)
+            df = pd.concat([df, appended.loc[start:end]], axis = 0)
+            
+        return df
+    
+    def _appendDtype(self, fields):
+        return np.dtype([('date', '<i8')] + [(f, '<f8') for f in fields])
+    
+    def _readAppended(self, path, fields):
+        '''
+        Bars ingested after the cache file was written, None if there are none
+        '''
+        log = path[:-len('.feather')] + '.append'
+        if not os.path.exists(log) or os.path.getsize(log) == 0:
+            return None
+        
+        rec = np.memmap(log, dtype = self._appendDtype(fields), mode = 'r')
+        index = pd.DatetimeIndex(rec['date'].astype('datetime64[ns]'), name = 'date')
+        
+        return pd.DataFrame({f: rec[f] for f in fields}, index = index)
+    
+    def _appendCache(self, pair, bars, fields):
+        '''
+        Append new bars to the cached store of a pair, O(new bars)
+        '''
+        path = self._cachePath(pair, fields)
+        if not os.path.exists(path):
+            self._writeCache(pair, fields, path)
+            
+        rec = np.empty(len(bars), dtype = self._appendDtype(fields))
+        rec['date'] = bars.index.values.astype('datetime64[ns]').view('i8')
+        for f in fields:
+            rec[f] = bars[f].to_numpy(dtype = np.float64)
+        with open(path[:-len('.feather')] + '.append', 'ab') as log:
+            rec.tofile(log)
+    
+    def _cacheLastDate(self, pair, fields):
+        '''
+        Last bar held by the cached store of a pair
+        '''
+        path = self._cachePath(pair, fields)
+        if not os.path.exists(path):
+            self._writeCache(pair, fields, path)
+            
+        appended = self._readAppended(path, fields)
+        if appended is not None:
+            return appended.index[-1]
+        dates = feather.read_table(path, columns = ['date'], memory_map = True).column('date')
+        
+        return pd.Timestamp(dates[len(dates) - 1].as_py()) if len(dates) else pd.Timestamp.min
+    
+    def stream(self, panel, h):
+        '''
+        Start incremental ingestion on top of a historical panel
+        
+        Runs the CUSUM filter once over the history of every pair to set up
+        sPos/sNeg, later bars are passed to ingest().
+
+        Parameters
+        ----------
+        panel : pair_panel
+            history, e.g. readPair(..., panel = True)
+        h : float
+            CUSUM threshold
+
+        Returns
+        -------
+        samples: dictionary of pandas index
+            CUSUM events of the history for all pairs
+
+        '''
+        self.panel = panel
+        self.h = h
+        self.cusum_state = {}
+        self._cacheEnd = {}
+        
+        samples = {}
+        closes = panel['close']
+        for pair in panel.pairs:
+            close = closes[pair].dropna()
+            state = {'sPos': 0., 'sNeg': 0., 'last': np.nan,
+                     'close': close.iloc[-1] if len(close) else np.nan}
+            samples[pair] = self.getTEvents(close.pct_change().iloc[1:], h, state = state)
+            self.cusum_state[pair] = state
+            if self.cache:
+                self._cacheEnd[pair] = self._cacheLastDate(pair, panel.fields)
+                
+        return samples
+    
+    def ingest(self, pair, bars):
+        '''
+        Append new hourly bars of one pair
+        
+        Updates the live panel and the cached store in place and carries the
+        CUSUM state forward, so the cost only depends on the number of new bars.
+
+        Parameters
+        ----------
+        pair : str
+            name of the pair
+        bars : pandas dataframe
+            new bars indexed by date, with the panel's fields as columns;
+            bars not newer than the last one of the pair are ignored
+
+        Returns
+        -------
+        pandas DatetimeIndex
+            CUSUM events among the new bars
+
+        '''
+        assert self.panel is not None, 'call stream() before ingest().'
+        
+        bars = bars.sort_index()
+        bars = bars.loc[bars.index > self.panel.lastDate(pair)]
+        if bars.shape[0] == 0:
+            return pd.DatetimeIndex([])
+        
+        self.panel.append(pair, bars)
+        if self.cache and pair in self._cacheEnd:
+            new = bars.loc[bars.index > self._cacheEnd[pair]]
+            if new.shape[0] > 0:
+                self._appendCache(pair, new[self.panel.fields], self.panel.fields)
+                self._cacheEnd[pair] = new.index[-1]
+                
+        state = self.cusum_state[pair]
+        close = bars['close'].to_numpy(dtype = np.float64)
+        r = close / np.concatenate([[state['close']], close[:-1]]) - 1
+        state['close'] = close[-1]
+        
+        return self.getTEvents(pd.Series(r, index = bars.index), self.h, state = state)
+    
+    
+    @profiled('cusumFilter', rows = 'r')
+    def cusumFilter(self, r, h):
+        '''
+        Cusum Filter for sampling data points
+        
+        Reference:
+        [1] APA. Lopez de Prado, M. (2018). Advances in financial machine learning, 38-40
+        [2] Lam, K. and H. Yam (1997): “CUSUM techniques for technical trading in financial markets.” 
+            Financial Engineering and the Japanese Markets, Vol. 4, pp. 257–274
+
+        Parameters
+        ----------
+        data : pandas series or dataframe
+            price used in calculating returns for all assets
+        h:
+            threshold for 
+
+        Returns
+        -------
+        samples: dictionary of pandas index
+            contains index of all the sample data points for all assets
+
+        '''
+        
+        # r = data.pct_change().iloc[1:]
+        
+        # one batched kernel call over all columns of the raw float array
+        diff = np.diff(r.to_numpy(dtype = np.float64), axis = 0)
+        sPos, sNeg = np.zeros(r.shape[1]), np.zeros(r.shape[1])
+        events = _cusum_columns(kernel_input(np.ascontiguousarray(diff.T)), h,
+                                kernel_input(sPos), kernel_input(sNeg))
+        
+        samples = {}
+        
+        for j, ticker in enumerate(r.columns):
+            samples[ticker] = self._eventIndex(r.index[1:], events[j])
+            
+        return samples
+        
+        
+    def getTEvents(self, gRaw, h, state = None):
+        '''
+        Cusum Filter for single time-series
+        
+        see:
+            APA. Lopez de Prado, M. (2018). Advances in financial machine learning, Page 39
+
+        Parameters
+        ----------
+        gRaw : pandas series
+            raw return series
+        h : float
+            threshold for sampling
+        state : dictionary, optional
+            carried CUSUM state {'sPos', 'sNeg', 'last'}, where 'last' is the
+            raw return before gRaw; updated in place, so consecutive chunks
+            give the same events as one call on the whole series
+
+        Returns
+        -------
+        list of index of the events
+
+        '''
+        g = gRaw.to_numpy(dtype = np.float64)
+        if state is None:
+            events, _, _ = _cusum(kernel_input(np.diff(g)), h, 0., 0.)
+            return self._eventIndex(gRaw.index[1:], events)
+        
+        if len(g) == 0:
+            return pd.DatetimeIndex([])
+        # a NaN 'last' resets the sums, same as skipping the first diff
+        events, state['sPos'], state['sNeg'] = _cusum(kernel_input(np.diff(g, prepend = state['last'])), h,
+                                                      state['sPos'], state['sNeg'])
+        state['last'] = g[-1]
+            
+        return self._eventIndex(gRaw.index, events)
+    
+    def _eventIndex(self, index, events):
+        '''
+        Map the kernel's event mask back to timestamps
+        '''
+        if not events.any():
+            return pd.DatetimeIndex([])
+        
+        return pd.DatetimeIndex(index[events], freq = None).rename(None)
+        
+
+
+class pair_panel:
+    '''
+    Wide panel of pairs aligned on one shared hourly index
+    
+    Every field is a dense float64 (time x pairs) block of one contiguous
+    (field x time x pairs) array, so field frames are views without copies.
+    The time axis keeps spare capacity so appended bars cost amortized O(1);
+    frames taken before an append are snapshots of the old rows.
+    '''
+    def __init__(self, index, pairs, fields, values):
+        '''
+        Parameters
+        ----------
+        index : pandas DatetimeIndex
+            shared hourly index
+        pairs : list
+            names of the pairs
+        fields : list
+            names of the fields
+        values : numpy array
+            (field x time x pairs) float64 array
+        '''
+        self.pairs = list(pairs)
+        self.fields = list(fields)
+        self._buf = np.ascontiguousarray(values, dtype = np.float64)
+        self._dates = np.asarray(index.values).copy()
+        self._n = len(index)
+        self._index = index
+        # row of the last bar of every pair, -1 if it has none
+        has_data = ~np.isnan(self._buf[:, :self._n]).all(axis = 0)
+        self._last = np.where(has_data.any(axis = 0), self._n - 1 - np.argmax(has_data[::-1], axis = 0), -1)
+        
+    @property
+    def values(self):
+        '''(field x time x pairs) array, no copy'''
+        return self._buf[:, :self._n]
+    
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = pd.DatetimeIndex(self._dates[:self._n], name = 'date')
+        return self._index
+        
+    @classmethod
+    def from_frames(cls, frames, fields):
+        '''
+        Align per-pair dataframes on the union of their indexes,
+        hours missing for a pair are NaN
+        '''
+        pairs = list(frames.keys())
+        index = pd.DatetimeIndex([])
+        for pair in pairs:
+            index = index.union(frames[pair].index)
+        index.name = 'date'
+        
+        values = np.full((len(fields), len(index), len(pairs)), np.nan)
+        for j, pair in enumerate(pairs):
+            pos = index.get_indexer(frames[pair].index)
+            values[:, pos, j] = frames[pair][fields].to_numpy(dtype = np.float64).T
+            
+        return cls(index, pairs, fields, values)
+    
+    def array(self, field):
+        '''(time x pairs) array of a field, no copy'''
+        return self.values[self.fields.index(field)]
+    
+    def __getitem__(self, field):
+        '''(time x pairs) dataframe view of a field, no copy'''
+        return pd.DataFrame(self.array(field), index = self.index, columns = self.pairs, copy = False)
+    
+    def pair(self, pair, dropna = True):
+        '''
+        (time x fields) dataframe of one pair, like readPair(...).loc[pair]
+        '''
+        df = pd.DataFrame(self.values[:, :, self.pairs.index(pair)].T, index = self.index, columns = self.fields)
+        
+        return df.dropna(how = 'all') if dropna else df
+    
+    def lastDate(self, pair):
+        '''
+        Last hour with data for a pair, Timestamp.min for empty pairs
+        '''
+        last = self._last[self.pairs.index(pair)]
+        
+        return pd.Timestamp(self._dates[last]) if last >= 0 else pd.Timestamp.min
+    
+    def append(self, pair, bars):
+        '''
+        Write new bars of one pair, hours after the last one extend the shared index
+
+        Parameters
+        ----------
+        pair : str
+            name of the pair
+        bars : pandas dataframe
+            bars sorted by date, with the panel's fields as columns
+
+        '''
+        j = self.pairs.index(pair)
+        dates = bars.index.values.astype(self._dates.dtype)
+        new = dates[dates > self._dates[self._n - 1]] if self._n else dates
+        
+        if self._n + len(new) > self._buf.shape[1]:
+            # double the capacity, amortized O(1) per appended hour
+            cap = max(2*self._buf.shape[1], self._n + len(new), 1024)
+            buf = np.full((self._buf.shape[0], cap, self._buf.shape[2]), np.nan)
+            buf[:, :self._n] = self._buf[:, :self._n]
+            grown = np.empty(cap, dtype = self._dates.dtype)
+            grown[:self._n] = self._dates[:self._n]
+            self._buf, self._dates = buf, grown
+        self._dates[self._n:self._n + len(new)] = new
+        self._buf[:, self._n:self._n + len(new)] = np.nan
+        self._n += len(new)
+        self._index = None
+        
+        pos = np.searchsorted(self._dates[:self._n], dates)
+        if (pos >= self._n).any() or (self._dates[np.minimum(pos, self._n - 1)] != dates).any():
+            raise ValueError(f'{pair}: bars older than the last hour must fall on an existing hour.')
+        self._buf[:, pos, j] = bars[self.fields].to_numpy(dtype = np.float64).T
+        self._last[j] = max(self._last[j], pos[-1])
+    
+    def stack(self):
+        '''
+        Long (pair, date) dataframe in the readPair layout
+        '''
+        return pd.concat({pair: self.pair(pair) for pair in self.pairs}, axis = 0)
+    
+    @property
+    def shape(self):
+        return self.values.shape
+    
+    @property
+    def bars(self):
+        '''Number of (pair, hour) bars with data, the rows of the stacked layout'''
+        return int((~np.isnan(self.values).all(axis = 0)).sum())
+    
+    def __repr__(self):
+        return f"pair_panel({len(self.fields)} fields x {len(self.index)} hours x {len(self.pairs)} pairs)"
+        
+
+
+"""For debug
+if __name__ == '__main__':
+    data = data_manager().readPair(pairs = "BTCUSD ETHUSD BATUSD FILUSD MKRUSD UNIUSD ZRXUSD",
+                               start='2020-11-01', end='2021-12-31')
+    btc_close = data.loc['BTCUSD'].close.to_frame(name = 'BTCUSD')
+    cusum = data_manager().cusumFilter(btc_close, .01)
+    print(cusum['BTCUSD'], btc_close.head(10).pct_change())
 """
\ No newline at end of file
@@ -1,153 +1,240 @@
-# -*- coding: utf-8 -*-
-"""
-Calculate indicators and feature engineering
-
-Created on Sat Aug  6 14:07:18 2022
-
-@author: Cookie
-"""
-
-import pandas as pd
-import numpy as np
-from talib import *
-from tqdm import tqdm
-
-class Indicators:
-    '''
-    Calculare Technical Indicators used to predict returns
-    '''
-
-    def __init__(self):
-        self.TAdict = {'ADX': self.adx, 'CCI': self.cci, 'MACD': self.macd_hist,
-                   'MOM': self.mom, 'RSI': self.rsi, 'FastK': self.fastk,
-                   'WILLR': self.willr, 'OBV': self.obv, 'AD': self.adline, 
-                   'ATR': self.natr, 'BlackCrows': self.tblackcrows, 
-                   'Inside': self.tinside, 'Beta': self.beta, 
-                   'Regression': self.linregslope, 'Volatility': self.vol}
-    
-    def adx(self, data, window = 14):
-        '''Calculate Average Directional Index
-        data:
-            HCL dataframe
-        '''
-        adx = ADX(data.high, data.low, data.close, window)
-        
-        return adx
-    
-    def cci(self, data, window = 14):
-        '''Calculate Commodity Channel Index
-        data:
-            HCL dataframe
-        '''
-        cci = CCI(data.high, data.low, data.close, window)
-        
-        return cci
-        
-    def macd_hist(self, data, fast = 12, slow = 26, signal = 9):
-        '''Caculate MACD histogram
-        '''
-        _, _, macd_hist = MACD(data.close, fast, slow, signal)
-        
-        return macd_hist
-    
-    def mom(self, data, window = 10):
-        '''Calculate momentum
-        '''
-        mom = data.close.pct_change(window)
-        
-    def rsi(self, data, window = 14):
-        '''Calculate Raletive Strength Index
-        '''
-        rsi = RSI(data.close, window)
-        
-        return rsi
-    
-    def fastk(self, data, k = 5, d = 3):
-        '''Calculate stochastic fast K
-        data:
-            HCL dataframe
-        '''
-        fastk, _ = STOCHF(data.high, data.low, data.close, k, d)
-        
-        return fastk
-    
-    def willr(self, data, window = 14):
-        '''Calculate William's %R
-        data:
-            HCL dataframe
-        '''
-        willr = WILLR(data.high, data.low, data.close, window)
-        
-        return willr
-    
-    def obv(self, data):
-        '''Calculate On-balance-volume
-        data:
-            close & volume
-        '''
-        obv = OBV(data.close, data.volume)
-        
-        return obv
-    
-    def adline(self, data, volume):
-        '''Calculate A/D line
-        '''
-        adline = AD(data.high, data.low, data.close, volume)
-        
-        return adline
-    
-    def natr(self, data, window = 14):
-        '''Calculate Normalized Average True Range
-        '''
-        natr = NATR(data.high, data.low, data.close, window)
-        
-        return natr
-
-    def tblackcrows(self, data):
-        '''Pattern recognition: three black crows
-        '''
-        tbc = CDL3BLACKCROWS(data.open, data.high, data.low, data.close)
-        
-        return tbc
-    
-    def tinside(self, data):
-        '''Pattern recognition: three inside up/down
-        '''
-        tin = CDL3INSIDE(data.open, data.high, data.low, data.close)
-        
-        return tin
-    
-    def beta(self, data, window = 5):
-        '''Beta between high and low
-        '''
-        beta = BETA(data.high, data.low, window)
-        
-    def linregslope(self, data, window = 14):
-        '''Linear regression slope
-        '''
-        slope = LINEARREG_SLOPE(data.close, window)
-        
-        return slope
-    
-    def vol(self, data, window = 5, nbdev = 1):
-        '''Volatility
-        '''
-        vol = data.close.rolling(window).std().mul(nbdev)
-        
-    def pool(self, data, params):
-        '''Calculate a pool of indicators
-        data:
-            OHCL dataframe
-        params: dictionary
-            contains the names of indicators and their parameters
-        '''
-        
-        ind = pd.DataFrame(index = data.index, columns = list(params.keys()))
-        for ta in params:
-            ind[ta] = self.TAdict[ta](data, **params[ta])
-            
-        return ind
-        
-    
-    
-    
\ No newline at end of file
+# -*- coding: utf-8 -*-
+"""
+Calculate indicators and feature engineering
+
+Created on Sat Aug  6 14:07:18 2022
+
+@author: Cookie
+"""
+
+import pandas as pd
+import numpy as np
+from types import SimpleNamespace
+from talib import *
+from tqdm import tqdm
+
+import profiler
+from compute import executor_class
+
+def _poolTask(args):
+    '''Worker for Indicators.panel_pool
+    '''
+    data, params, engine = args
+    
+    return Indicators().pool(data, params, engine)
+
+
+class Indicators:
+    '''
+    Calculare Technical Indicators used to predict returns
+    '''
+
+    def __init__(self):
+        self.TAdict = {'ADX': self.adx, 'CCI': self.cci, 'MACD': self.macd_hist,
+                   'MOM': self.mom, 'RSI': self.rsi, 'FastK': self.fastk,
+                   'WILLR': self.willr, 'OBV': self.obv, 'AD': self.adline, 
+                   'ATR': self.natr, 'BlackCrows': self.tblackcrows, 
+                   'Inside': self.tinside, 'Beta': self.beta, 
+                   'Regression': self.linregslope, 'Volatility': self.vol}
+        # array versions for the indicators written with pandas operations,
+        # the TA-Lib ones take the raw arrays as they are
+        self.TAarray = {'MOM': self._mom_array, 'Volatility': self._vol_array}
+    
+    def adx(self, data, window = 14):
+        '''Calculate Average Directional Index
+        data:
+            HCL dataframe
+        '''
+        adx = ADX(data.high, data.low, data.close, window)
+        
+        return adx
+    
+    def cci(self, data, window = 14):
+        '''Calculate Commodity Channel Index
+        data:
+            HCL dataframe
+        '''
+        cci = CCI(data.high, data.low, data.close, window)
+        
+        return cci
+        
+    def macd_hist(self, data, fast = 12, slow = 26, signal = 9):
+        '''Caculate MACD histogram
+        '''
+        _, _, macd_hist = MACD(data.close, fast, slow, signal)
+        
+        return macd_hist
+    
+    def mom(self, data, window = 10):
+        '''Calculate momentum
+        '''
+        mom = data.close.pct_change(window)
+        
+        return mom
+        
+    def rsi(self, data, window = 14):
+        '''Calculate Raletive Strength Index
+        '''
+        rsi = RSI(data.close, window)
+        
+        return rsi
+    
+    def fastk(self, data, k = 5, d = 3):
+        '''Calculate stochastic fast K
+        data:
+            HCL dataframe
+        '''
+        fastk, _ = STOCHF(data.high, data.low, data.close, k, d)
+        
+        return fastk
+    
+    def willr(self, data, window = 14):
+        '''Calculate William's %R
+        data:
+            HCL dataframe
+        '''
+        willr = WILLR(data.high, data.low, data.close, window)
+        
+        return willr
+    
+    def obv(self, data):
+        '''Calculate On-balance-volume
+        data:
+            close & volume
+        '''
+        obv = OBV(data.close, data.volume)
+        
+        return obv
+    
+    def adline(self, data, volume):
+        '''Calculate A/D line
+        '''
+        adline = AD(data.high, data.low, data.close, volume)
+        
+        return adline
+    
+    def natr(self, data, window = 14):
+        '''Calculate Normalized Average True Range
+        '''
+        natr = NATR(data.high, data.low, data.close, window)
+        
+        return natr
+
+    def tblackcrows(self, data):
+        '''Pattern recognition: three black crows
+        '''
+        tbc = CDL3BLACKCROWS(data.open, data.high, data.low, data.close)
+        
+        return tbc
+    
+    def tinside(self, data):
+        '''Pattern recognition: three inside up/down
+        '''
+        tin = CDL3INSIDE(data.open, data.high, data.low, data.close)
+        
+        return tin
+    
+    def beta(self, data, window = 5):
+        '''Beta between high and low
+        '''
+        beta = BETA(data.high, data.low, window)
+        
+        return beta
+        
+    def linregslope(self, data, window = 14):
+        '''Linear regression slope
+        '''
+        slope = LINEARREG_SLOPE(data.close, window)
+        
+        return slope
+    
+    def vol(self, data, window = 5, nbdev = 1):
+        '''Volatility
+        '''
+        vol = data.close.rolling(window).std().mul(nbdev)
+        
+        return vol
+    
+    def _mom_array(self, data, window = 10):
+        '''Momentum on raw arrays, same as close.pct_change(window)
+        '''
+        mom = np.full(data.close.shape[0], np.nan)
+        mom[window:] = data.close[window:] / data.close[:-window] - 1
+        
+        return mom
+    
+    def _vol_array(self, data, window = 5, nbdev = 1):
+        '''Volatility on raw arrays, same as close.rolling(window).std()
+        pandas' online rolling variance is kept so the values match bit for bit
+        '''
+        vol = pd.Series(data.close, copy = False).rolling(window).std().to_numpy() * nbdev
+        
+        return vol
+        
+    @profiler.profiled('Indicators.pool', rows = 'data')
+    def pool(self, data, params, engine = 'batch'):
+        '''Calculate a pool of indicators
+        data:
+            OHCL dataframe
+        params: dictionary
+            contains the names of indicators and their parameters
+        engine:
+            'batch' computes everything on raw float64 arrays into one matrix,
+            'loop' fills a dataframe column by column
+        '''
+        if engine == 'batch':
+            return self._pool_batch(data, params)
+        
+        ind = pd.DataFrame(index = data.index, columns = list(params.keys()))
+        for ta in params:
+            ind[ta] = self.TAdict[ta](data, **params[ta])
+            
+        return ind
+    
+    def _pool_batch(self, data, params):
+        '''Single pass over the bars: the OHLCV columns are pulled out once as
+        contiguous float64 arrays and every indicator is written into a
+        preallocated float64 matrix
+        '''
+        bars = SimpleNamespace(**{f: np.ascontiguousarray(data[f].to_numpy(dtype = np.float64))
+                                  for f in ['open', 'high', 'low', 'close', 'volume'] if f in data.columns})
+        
+        ind = np.empty((data.shape[0], len(params)), dtype = np.float64)
+        for k, ta in enumerate(params):
+            ind[:, k] = self.TAarray.get(ta, self.TAdict[ta])(bars, **params[ta])
+            
+        return pd.DataFrame(ind, index = data.index, columns = list(params.keys()), copy = False)
+    
+    def panel_pool(self, data, params, workers = None, executor = 'process', engine = 'batch'):
+        '''Calculate the pool of indicators for every asset of a panel in one call
+        data:
+            (pair, date) dataframe from data_manager.readPair, or a pair_panel
+        params: dictionary
+            contains the names of indicators and their parameters
+        workers:
+            number of assets computed concurrently, None or 1 runs them one by one
+        executor:
+            'process' or 'thread' pool
+        Returns:
+            (pair, date) dataframe of indicators, assets in the order of the panel
+        '''
+        if hasattr(data, 'pairs'):
+            assets = data.pairs
+            frames = [data.pair(pair) for pair in assets]
+        else:
+            assets = list(data.index.get_level_values(0).unique())
+            frames = [data.loc[asset] for asset in assets]
+        
+        tasks = [(frame, params, engine) for frame in frames]
+        if workers is None or workers <= 1 or len(assets) == 1:
+            results = []
+            for asset, frame in zip(assets, frames):
+                with profiler.asset(asset):
+                    results.append(self.pool(frame, params, engine))
+        else:
+            pool = executor_class(executor)
+            with pool(max_workers = min(workers, len(assets))) as ex:
+                # map keeps the asset order, so the stacked result is deterministic
+                results = list(tqdm(ex.map(_poolTask, tasks), 'Indicators...', total = len(assets)))
+                
+        return pd.concat(dict(zip(assets, results)), axis = 0)
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of indicator features
+
+Created on Sun Oct 18 19:05:47 2026
+
+@author: Cookie
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+from feature_engineering import Indicators
+from online_indicators import OnlineIndicators
+
+
+class feature_store:
+    '''
+    Disk cache around Indicators.pool
+
+    Every indicator series is stored under the hash of its name, its parameters
+    and a fingerprint of the input bars. A small meta file per (pair, indicator,
+    params) remembers the last version, so when the same bars come back with new
+    ones appended only the new bars are computed: the recursive indicators resume
+    from their online state, the others are recomputed. The online state is only
+    built when a series is first extended and is kept in the meta from then on.
+    '''
+    def __init__(self, storedir, max_bytes = 2**30):
+        '''
+        Parameters
+        ----------
+        storedir : str
+            directory of the cache
+        max_bytes : int
+            size limit of the stored features, least recently used ones are evicted
+        '''
+        self.storedir = storedir
+        self.max_bytes = max_bytes
+        self.indicators = Indicators()
+        os.makedirs(storedir, exist_ok = True)
+
+    def pool(self, data, params, pair = ''):
+        '''
+        Cached Indicators.pool
+
+        Parameters
+        ----------
+        data : pandas dataframe
+            OHLCV bars of one pair
+        params : dictionary
+            contains the names of indicators and their parameters
+        pair : str
+            name of the pair, only used to find earlier versions of the series
+
+        Returns
+        -------
+        pandas dataframe
+            same as Indicators.pool(data, params)
+
+        '''
+        fields = [f for f in ['open', 'high', 'low', 'close', 'volume'] if f in data.columns]
+        arrays = [np.ascontiguousarray(data.index.values).view('i8')] + \
+                 [np.ascontiguousarray(data[f].to_numpy(dtype = np.float64)) for f in fields]
+        # the bars are hashed once per call, prefixes once per length
+        prints = {data.shape[0]: self._fingerprint(arrays, data.shape[0])}
+        
+        ind = np.empty((data.shape[0], len(params)), dtype = np.float64)
+        missing, written = {}, False
+        for k, ta in enumerate(params):
+            values, extended = self._cached(data, arrays, prints, pair, ta, params[ta])
+            written |= extended
+            if values is None:
+                missing[ta] = k
+            else:
+                ind[:, k] = values
+        
+        if missing:
+            # one batched pool call for everything not in the store
+            computed = self.indicators.pool(data, {ta: params[ta] for ta in missing})
+            for ta, k in missing.items():
+                ind[:, k] = computed[ta].to_numpy()
+                self._store(ind[:, k], prints[data.shape[0]], pair, ta, params[ta], None)
+        if missing or written:
+            self._evict()
+
+        return pd.DataFrame(ind, index = data.index, columns = list(params.keys()), copy = False)
+
+    def _fingerprint(self, arrays, n):
+        '''Hash of the dates and bars of the first n rows'''
+        h = hashlib.sha1()
+        for a in arrays:
+            h.update(a[:n])
+
+        return h.hexdigest()
+
+    def _keys(self, pair, ta, param):
+        spec = json.dumps([ta, param], sort_keys = True)
+        stem = hashlib.sha1(f"{pair}|{spec}".encode()).hexdigest()[:20]
+
+        return spec, stem
+
+    def _path(self, name):
+        return os.path.join(self.storedir, name)
+
+    def _cached(self, data, arrays, prints, pair, ta, param):
+        '''
+        One indicator series from the store: exact hit, extension of a cached prefix, or None,
+        and whether a new version was written
+        '''
+        n = data.shape[0]
+        spec, stem = self._keys(pair, ta, param)
+        key = hashlib.sha1(f"{spec}|{prints[n]}".encode()).hexdigest()[:20]
+
+        # exact hit
+        if os.path.exists(self._path(f"{key}.npy")):
+            os.utime(self._path(f"{key}.npy"))
+            return np.load(self._path(f"{key}.npy"), mmap_mode = 'r'), False
+
+        meta = self._readMeta(stem)
+        if (meta is None or ta not in OnlineIndicators.TAonline or not 0 < meta['n'] < n
+                or not os.path.exists(self._path(f"{meta['key']}.npy"))):
+            return None, False
+        m = meta['n']
+        if m not in prints:
+            prints[m] = self._fingerprint(arrays, m)
+        if prints[m] != meta['fp']:
+            return None, False
+
+        # extension: resume the online state over the new bars only. The state is
+        # built lazily by the first extension of a series and kept from then on
+        online = OnlineIndicators({ta: param})
+        try:
+            online.set_state(meta['state'])
+        except (TypeError, ValueError):
+            # not built yet, or saved by an older version of the indicator
+            online = OnlineIndicators({ta: param})
+            online.replay(data.iloc[:m])
+        values = np.concatenate([np.load(self._path(f"{meta['key']}.npy")), online.replay(data.iloc[m:])[ta].to_numpy()])
+        # the previous version stays, e.g. for an overlapping range, until the LRU pass evicts it
+        self._store(values, prints[n], pair, ta, param, online.get_state())
+
+        return values, True
+
+    def _store(self, values, fp, pair, ta, param, state):
+        spec, stem = self._keys(pair, ta, param)
+        key = hashlib.sha1(f"{spec}|{fp}".encode()).hexdigest()[:20]
+        np.save(self._path(f"{key}.npy"), values)
+        self._writeMeta(stem, {'key': key, 'n': len(values), 'fp': fp, 'pair': pair, 'spec': spec,
+                               'state': state})
+
+    def _readMeta(self, stem):
+        try:
+            with open(self._path(f"{stem}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _writeMeta(self, stem, meta):
+        tmp = self._path(f"{stem}.json.{os.getpid()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._path(f"{stem}.json"))
+
+    def _evict(self):
+        '''
+        Drop the least recently used features until the store fits in max_bytes
+        '''
+        files = []
+        for f in os.listdir(self.storedir):
+            if f.endswith('.npy'):
+                st = os.stat(self._path(f))
+                files.append((st.st_mtime, st.st_size, f))
+        total = sum(size for _, size, _ in files)
+
+        for _, size, f in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(self._path(f))
+            total -= size
+
+    def clear(self):
+        '''Remove every cached feature'''
+        for f in os.listdir(self.storedir):
+            if f.endswith(('.npy', '.json')):
+                os.remove(self._path(f))
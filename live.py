@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Live hourly trading loop
+
+Bars of every pair arrive concurrently on asyncio tasks, from local files or a
+socket. Each bar updates the online indicators of its pair (the features are
+their differences, as in the notebook). Once all pairs have sent a bar, or
+max_wait has passed, the bar is processed: one batched forest call for all
+pairs, the band signals and, on the rebalance schedule only, new
+minimum-variance weights. The target weights are then published. State per
+pair is bounded, so the cost of a bar only grows with the number of pairs
+through the batched steps.
+
+Created on Mon Oct 19 20:05:13 2026
+
+@author: Cookie
+"""
+
+import json
+import time
+import asyncio
+import inspect
+import argparse
+import numpy as np
+import pandas as pd
+from collections import deque
+
+from online_indicators import OnlineIndicators
+from random_forest import compiled_forest
+from portfolio_optimizer import portfolio_optimizer
+
+
+async def replay_bars(bars, delay = 0.):
+    '''
+    Stand-in feed replaying stored bars of one pair
+
+    Parameters
+    ----------
+    bars : pandas dataframe
+        OHLCV bars indexed by date, e.g. readPair(...).loc[pair]
+    delay : float
+        seconds between bars
+
+    '''
+    for date, bar in zip(bars.index, bars.to_dict('records')):
+        await asyncio.sleep(delay)
+        yield date, bar
+
+
+async def socket_bars(host, port):
+    '''
+    Feed of one pair from a socket, one json bar per line, e.g.
+    {"date": "2021-09-01 00:00:00", "open": ..., "high": ..., "low": ..., "close": ..., "volume": ...}
+    '''
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while line := await reader.readline():
+            bar = json.loads(line)
+            yield pd.Timestamp(bar.pop('date')), bar
+    finally:
+        writer.close()
+
+
+class live_trader:
+    '''
+    Incremental features, predictions, signals and weights of the notebook strategy
+    '''
+    def __init__(self, model, params, history, window = 10, band = 1., rebalance = 'W', solver = 'active_set',
+                 max_wait = 1., publish = None):
+        '''
+        Parameters
+        ----------
+        model : RandomForestRegressor, tree_pool or compiled_forest
+            forest trained on the differenced indicators
+        params : dictionary
+            indicators and their parameters, in the order of the training columns
+        history : pandas dataframe
+            (pair, date) bars from data_manager.readPair to warm up the state
+        window : int
+            rolling window of the signal bands
+        band : float
+            band multiplier of the rolling standard deviation
+        rebalance : str
+            period of the weights, a pandas frequency
+        solver : str
+            solver of portfolio_optimizer
+        max_wait : float
+            seconds a bar waits for the other pairs before it is processed without them
+        publish : function
+            publish(date, targets) called with the target weights of every bar,
+            coroutine functions are scheduled without waiting for them
+        '''
+        self.model = model if isinstance(model, compiled_forest) else compiled_forest(model)
+        self.params = params
+        self.pairs = list(history.index.get_level_values(0).unique())
+        self._col = {pair: j for j, pair in enumerate(self.pairs)}
+        self.window = window
+        self.band = band
+        self.rebalance = rebalance
+        self.optimizer = portfolio_optimizer(solver = solver)
+        self.max_wait = max_wait
+        self.publish = publish
+
+        n = len(self.pairs)
+        self.online, self.indicator, self.close, self.returns = {}, {}, {}, {}
+        for pair in self.pairs:
+            bars = history.loc[pair]
+            self.online[pair] = OnlineIndicators(params)
+            self.indicator[pair] = self.online[pair].replay(bars).to_numpy()[-1]
+            self.close[pair] = bars.close.iloc[-1]
+            self.returns[pair] = deque(bars.close.pct_change().iloc[-window:].tolist(), maxlen = window)
+        self.signals = np.full(n, np.nan)
+
+        # weights of the last complete period of the history
+        closes = history.close.unstack(level = 0)[self.pairs]
+        r = closes.pct_change().iloc[1:]
+        period = r.index.to_period(rebalance)
+        self.period = period[-1]
+        done = period < self.period
+        last = r.loc[period == period[done].max()].dropna() if done.any() else r.iloc[:0]
+        self.weights = self.optimizer.mvp(self.optimizer.getCovMat(last)) if len(last) > 1 else np.full(n, 1 / n)
+        self._periodReturns = list(r.loc[period == self.period].to_numpy())
+
+        self.targets = pd.Series(np.nan, index = self.pairs)
+        self._pending = {}
+        self._timers = {}
+        self.last_date = history.index.get_level_values(1).max()
+        # (date, pair, seconds from arrival to publication) of every bar
+        self.latency = []
+
+    async def run(self, feeds):
+        '''
+        Trade until every feed is exhausted
+
+        Parameters
+        ----------
+        feeds : dictionary
+            pair -> async iterator of (date, bar), e.g. replay_bars or socket_bars
+
+        '''
+        await asyncio.gather(*[self._consume(pair, feed) for pair, feed in feeds.items()])
+        # bars still waiting for pairs whose feeds have ended
+        for date in sorted(self._pending):
+            self._step(date)
+
+    async def _consume(self, pair, feed):
+        async for date, bar in feed:
+            self.on_bar(pair, date, bar)
+
+    def on_bar(self, pair, date, bar):
+        '''
+        Update the features of one pair, the bar is processed once all pairs have it
+        '''
+        received = time.perf_counter()
+        value = self.online[pair].update(bar)
+        feature = value - self.indicator[pair]
+        self.indicator[pair] = value
+        r = bar['close'] / self.close[pair] - 1
+        self.close[pair] = bar['close']
+        self.returns[pair].append(r)
+        if date <= self.last_date:
+            # too late, the bar has been processed without this pair
+            return
+
+        pending = self._pending.setdefault(date, {})
+        pending[pair] = (feature, r, received)
+        if len(pending) == len(self.pairs):
+            self._step(date)
+        elif len(pending) == 1:
+            self._timers[date] = asyncio.get_running_loop().call_later(self.max_wait, self._expire, date)
+
+    def _expire(self, date):
+        if date in self._pending:
+            self._step(date)
+
+    def _step(self, date):
+        '''
+        Predictions, signals, weights and targets of one bar, earlier bars first
+        '''
+        for earlier in sorted(d for d in self._pending if d < date):
+            self._step(earlier)
+        arrived = self._pending.pop(date)
+        timer = self._timers.pop(date, None)
+        if timer is not None:
+            timer.cancel()
+        self.last_date = date
+
+        cols = [self._col[pair] for pair in arrived]
+        X = np.stack([feature for feature, _, _ in arrived.values()])
+        pred = self.model.predict(X)
+
+        # rolling moments of the realized returns, same as rollmean/rollstd of the notebook
+        # pairs with a shorter history are NaN-padded on the left
+        R = np.full((len(arrived), self.window), np.nan)
+        for j, pair in enumerate(arrived):
+            if self.returns[pair]:
+                R[j, -len(self.returns[pair]):] = self.returns[pair]
+        count = (~np.isnan(R)).sum(axis = 1)
+        full = count == self.window
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            mean = np.nansum(R, axis = 1) / count
+            width = self.band * np.sqrt(np.nansum((R - mean[:, None])**2, axis = 1) / (count - 1))
+        signal = np.where(full & (pred > mean + width), 1., 0.) - np.where(full & (pred < mean - width), 1., 0.)
+        self.signals[cols] = np.where(signal != 0, signal, self.signals[cols])
+
+        period = pd.Timestamp(date).to_period(self.rebalance)
+        if period != self.period:
+            self._rebalance()
+            self.period = period
+        row = np.full(len(self.pairs), np.nan)
+        row[cols] = [r for _, r, _ in arrived.values()]
+        self._periodReturns.append(row)
+
+        self.targets = pd.Series(self.weights * np.nan_to_num(self.signals), index = self.pairs)
+        if self.publish is not None:
+            out = self.publish(date, self.targets)
+            if inspect.isawaitable(out):
+                asyncio.ensure_future(out)
+
+        done = time.perf_counter()
+        self.latency.extend((date, pair, done - received) for pair, (_, _, received) in arrived.items())
+
+    def _rebalance(self):
+        '''
+        Minimum-variance weights of the period that just ended
+        '''
+        r = pd.DataFrame(self._periodReturns, columns = self.pairs).dropna()
+        if len(r) > 1:
+            self.weights = self.optimizer.mvp(self.optimizer.getCovMat(r))
+        self._periodReturns = []
+
+    def latency_report(self, quantiles = (0.5, 0.9, 0.99, 1.)):
+        '''
+        Quantiles of the end-to-end latency in milliseconds, overall and per pair
+        '''
+        lat = pd.DataFrame(self.latency, columns = ['date', 'pair', 'seconds'])
+        report = lat.groupby('pair')['seconds'].quantile(list(quantiles)).unstack() * 1e3
+        report.loc['all'] = lat['seconds'].quantile(list(quantiles)).to_numpy() * 1e3
+
+        return report
+
+
+if __name__ == '__main__':
+    # replays the backtest period of local files through the live loop,
+    # with the model of the notebook settings trained (or read) by the pipeline
+    from pipeline import pipeline, DEFAULTS
+
+    parser = argparse.ArgumentParser(description = 'Live hourly trading loop on replayed bars')
+    parser.add_argument('--datadir', default = DEFAULTS['datadir'])
+    parser.add_argument('--cachedir', default = None)
+    parser.add_argument('--delay', type = float, default = 0.)
+    args = parser.parse_args()
+
+    cfg = {**DEFAULTS, 'datadir': args.datadir}
+    out = pipeline.crypto(cachedir = args.cachedir).run(cfg, targets = ['load', 'model'])
+    data_model, data_bt = out['load']
+
+    trader = live_trader(out['model'], cfg['params'], data_model, window = cfg['band_window'], band = cfg['band'],
+                         rebalance = cfg['rebalance'], solver = cfg['solver'])
+    feeds = {pair: replay_bars(data_bt.loc[pair], args.delay) for pair in trader.pairs}
+    asyncio.run(trader.run(feeds))
+    print(trader.targets)
+    print(trader.latency_report())
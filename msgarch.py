@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+Two-regime Markov-Switching GARCH, fitted per pair by maximum likelihood
+
+Python counterpart of the MSGARCH specification in msgarch_regime.Rmd:
+a GARCH(1,1) per regime following Haas et al. (2004), whose variances all
+evolve on the observed returns so the Hamilton filter stays exact, with
+normal or GED innovations.
+
+Reference:
+Haas, M., Mittnik, S., & Paolella, M. S. (2004). A new approach to Markov-switching GARCH models.
+    Journal of Financial Econometrics, 2(4), 493-530
+Ardia, D., Bluteau, K., Boudt, K., & Catania, L. (2017). Forecasting risk with Markov-switching GARCH models:
+    A large-scale performance study. International Journal of Forecasting, 34(4)
+
+Created on Sun Oct 18 21:36:02 2026
+
+@author: Cookie
+"""
+
+import math
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+
+# without numba the filter below runs as a plain Python loop
+from compute import njit, kernel_input, executor_class
+
+
+def _ms_filter(y, par, state, probs, var):
+    '''
+    Hamilton filter of the two-regime Haas MS-GARCH(1,1) over y
+
+    Parameters
+    ----------
+    y : array
+        returns
+    par : array
+        omega, alpha, beta of regime 1 and of regime 2, p11, p22, GED shapes of both regimes
+    state : array
+        [h1, h2, xi]: variances of both regimes for the next bar and filtered
+        probability of regime 1 at the last bar, updated in place
+    probs, var : array
+        outputs, filtered probability of regime 1 at every bar and variance
+        forecast of the next bar
+
+    Returns
+    -------
+    float
+        log-likelihood
+
+    '''
+    w1, a1, b1, w2, a2, b2, p11, p22, nu1, nu2 = par[0], par[1], par[2], par[3], par[4], par[5], \
+        par[6], par[7], par[8], par[9]
+    # unit-variance GED: log density constant and scale, the normal is shape 2
+    lam1 = math.sqrt(2**(-2/nu1) * math.exp(math.lgamma(1/nu1) - math.lgamma(3/nu1)))
+    lam2 = math.sqrt(2**(-2/nu2) * math.exp(math.lgamma(1/nu2) - math.lgamma(3/nu2)))
+    c1 = math.log(nu1) - math.log(lam1) - (1 + 1/nu1)*math.log(2) - math.lgamma(1/nu1)
+    c2 = math.log(nu2) - math.log(lam2) - (1 + 1/nu2)*math.log(2) - math.lgamma(1/nu2)
+
+    h1, h2, xi = state[0], state[1], state[2]
+    loglik = 0.
+    for t in range(len(y)):
+        pred = xi*p11 + (1 - xi)*(1 - p22)
+        s1, s2 = math.sqrt(h1), math.sqrt(h2)
+        f1 = math.exp(c1 - .5*(abs(y[t])/(s1*lam1))**nu1) / s1
+        f2 = math.exp(c2 - .5*(abs(y[t])/(s2*lam2))**nu2) / s2
+        lik = pred*f1 + (1 - pred)*f2
+        if lik > 0:
+            xi = pred*f1 / lik
+            loglik += math.log(lik)
+        else:
+            # both densities underflow, keep the prediction
+            xi = pred
+            loglik += -745.
+        h1 = w1 + a1*y[t]**2 + b1*h1
+        h2 = w2 + a2*y[t]**2 + b2*h2
+        pred = xi*p11 + (1 - xi)*(1 - p22)
+        probs[t] = xi
+        var[t] = pred*h1 + (1 - pred)*h2
+
+    state[0], state[1], state[2] = h1, h2, xi
+
+    return loglik
+
+
+if njit is not None:
+    _ms_filter = njit(cache = True)(_ms_filter)
+
+
+def _fitTask(args):
+    '''
+    Fit one pair, module level so that process workers can run it
+    '''
+    y, distribution, options = args
+
+    return msgarch(distribution, **options).fit(y)
+
+
+class msgarch:
+    '''
+    Two-regime MS-GARCH(1,1), regime 1 being the low volatility one
+    '''
+    def __init__(self, distribution = 'norm', maxiter = 500):
+        '''
+        Parameters
+        ----------
+        distribution : str
+            'norm' or 'ged' innovations, the same in both regimes
+        maxiter : int
+            iteration limit of the likelihood maximization
+        '''
+        assert distribution in ('norm', 'ged'), 'distribution must be norm or ged.'
+        self.distribution = distribution
+        self.maxiter = maxiter
+        self.params_ = None
+
+    def _unpack(self, theta):
+        '''
+        Unconstrained optimizer vector to model parameters: positive omegas,
+        alpha + beta < 1 per regime, transition probabilities in (0, 1)
+        and GED shapes in (0.5, 5)
+        '''
+        sig = lambda v: 1 / (1 + np.exp(-v))
+        par = np.empty(10)
+        for k in range(2):
+            rho = sig(theta[3*k + 1]) * .9999
+            par[3*k] = np.exp(theta[3*k])
+            par[3*k + 1] = rho * sig(theta[3*k + 2])
+            par[3*k + 2] = rho - par[3*k + 1]
+        par[6:8] = sig(theta[6:8])
+        par[8:10] = .5 + 4.5*sig(theta[8:10]) if self.distribution == 'ged' else 2.
+
+        return par
+
+    def _run(self, y, par, state):
+        '''Filter y from state, returns log-likelihood, regime 1 probabilities and variance forecasts'''
+        n = len(y)
+        probs, var = np.empty(n), np.empty(n)
+        if njit is None:
+            probs, var, state = [0.]*n, [0.]*n, list(state)
+        loglik = _ms_filter(kernel_input(y), par, state, probs, var)
+
+        return loglik, np.asarray(probs), np.asarray(var), np.asarray(state, dtype = np.float64)
+
+    def fit(self, y):
+        '''
+        Maximum likelihood fit, then filter of the whole series
+
+        Parameters
+        ----------
+        y : pandas series
+            return series of one pair, missing values are dropped
+
+        Returns
+        -------
+        self, with
+            params_ : dict of the parameters
+            loglik_ : log-likelihood
+            probs_ : dataframe of the filtered low/high regime probabilities
+            sigma_ : series, volatility forecast of the next bar made at each bar
+            state_ : [h1, h2, xi] after the last bar
+
+        '''
+        y = y.dropna()
+        values = y.to_numpy(dtype = np.float64)
+        # fit on unit-variance returns, omegas are scaled back below
+        scale = values.std()
+        z = values / scale
+
+        def nll(theta):
+            loglik = self._run(z, self._unpack(theta), np.array([1., 1., .5]))[0]
+            return -loglik if np.isfinite(loglik) else 1e10
+
+        # low regime: variance ~ 0.5, high regime: ~ 2, both persistent
+        theta0 = np.array([np.log(.025), 3., 2., np.log(.15), 2.5, 1., 3., 3., 0., 0.])
+        opt = minimize(nll, theta0, method = 'L-BFGS-B', options = {'maxiter': self.maxiter})
+        par = self._unpack(opt.x)
+        par[[0, 3]] *= scale**2
+
+        # regime 1 is the one with the lower unconditional variance
+        if par[0]/(1 - par[1] - par[2]) > par[3]/(1 - par[4] - par[5]):
+            par = par[[3, 4, 5, 0, 1, 2, 7, 6, 9, 8]]
+
+        self.par_ = par
+        self.params_ = dict(zip(['omega_1', 'alpha_1', 'beta_1', 'omega_2', 'alpha_2', 'beta_2',
+                                 'p11', 'p22', 'nu_1', 'nu_2'], par))
+        self.converged_ = opt.success
+        self.loglik_, self.probs_, self.sigma_, self.state_ = self.filter(y)
+
+        return self
+
+    def filter(self, y, state = None):
+        '''
+        Run the fitted model over a return series
+
+        Parameters
+        ----------
+        y : pandas series
+            returns
+        state : array
+            [h1, h2, xi] to start from, e.g. state_ of an earlier run,
+            default: sample variance and stationary regime probabilities
+
+        Returns
+        -------
+        loglik : float
+        probs : pandas dataframe
+            filtered probabilities of the low and high volatility regimes
+        sigma : pandas series
+            volatility forecast of the next bar, made at each bar
+        state : numpy array
+            [h1, h2, xi] after the last bar
+
+        '''
+        y = y.dropna()
+        par = self.par_
+        if state is None:
+            p11, p22 = par[6], par[7]
+            state = np.array([y.var(), y.var(), (1 - p22) / (2 - p11 - p22)])
+        loglik, probs, var, state = self._run(y.to_numpy(dtype = np.float64), par, np.array(state, dtype = np.float64))
+
+        probs = pd.DataFrame({'low': probs, 'high': 1 - probs}, index = y.index)
+        sigma = pd.Series(np.sqrt(var), index = y.index, name = y.name)
+
+        return loglik, probs, sigma, state
+
+    def forecast(self, steps = 1, state = None):
+        '''
+        Variance forecasts of the next steps bars
+
+        Parameters
+        ----------
+        steps : int
+            horizon in bars
+        state : array
+            [h1, h2, xi], default: state_ after the fitted series
+
+        Returns
+        -------
+        numpy array
+            variance forecast of each of the next steps bars
+
+        '''
+        par = self.par_
+        state = self.state_ if state is None else state
+        P = np.array([[par[6], 1 - par[6]], [1 - par[7], par[7]]])
+        omega, alpha, beta = par[[0, 3]], par[[1, 4]], par[[2, 5]]
+
+        pi = np.array([state[2], 1 - state[2]]) @ P
+        h = np.array(state[:2], dtype = np.float64)
+        var = np.empty(steps)
+        for j in range(steps):
+            var[j] = pi @ h
+            h = omega + alpha*var[j] + beta*h
+            pi = pi @ P
+
+        return var
+
+    def fit_panel(self, r, workers = None, executor = 'process'):
+        '''
+        Fit every pair, in parallel
+
+        Parameters
+        ----------
+        r : pandas dataframe
+            (time x pairs) return series
+        workers : int
+            number of concurrent fits, default: one after the other
+        executor : str
+            'process' or 'thread' pool when workers > 1
+
+        Returns
+        -------
+        dict
+            fitted msgarch of each pair
+
+        '''
+        args = [(r[pair], self.distribution, {'maxiter': self.maxiter}) for pair in r.columns]
+        if workers is None or workers <= 1 or len(args) == 1:
+            return {pair: _fitTask(a) for pair, a in zip(r.columns, args)}
+
+        pool = executor_class(executor)
+        with pool(max_workers = min(workers, len(args))) as ex:
+            return dict(zip(r.columns, ex.map(_fitTask, args)))
+
+
+class regime_filter:
+    '''
+    Online Hamilton filter of fitted msgarch models, one vectorized step per bar for all pairs
+
+    Holds the parameters and the [h1, h2, xi] state of every pair, so the live
+    system updates the regime probabilities and the volatility forecasts bar by
+    bar without refitting or refiltering the history.
+    '''
+    def __init__(self, models):
+        '''
+        Parameters
+        ----------
+        models : dictionary
+            fitted msgarch of each pair, e.g. from msgarch.fit_panel; the
+            filter starts from their state after the fitted history
+        '''
+        self.pairs = list(models)
+        self.par = np.array([models[pair].par_ for pair in self.pairs])
+        self.h = np.array([models[pair].state_[:2] for pair in self.pairs], dtype = np.float64)
+        self.xi = np.array([models[pair].state_[2] for pair in self.pairs], dtype = np.float64)
+        self._constants()
+
+    def _constants(self):
+        '''(pairs x regimes) GED scales and log density constants, as in _ms_filter'''
+        nu = self.par[:, 8:10]
+        lgamma = np.vectorize(math.lgamma)
+        self.lam = np.sqrt(2**(-2/nu) * np.exp(lgamma(1/nu) - lgamma(3/nu)))
+        self.const = np.log(nu) - np.log(self.lam) - (1 + 1/nu)*np.log(2) - lgamma(1/nu)
+
+    def update(self, r):
+        '''
+        Filter one bar of every pair
+
+        Parameters
+        ----------
+        r : dictionary, pandas series or array
+            return of each pair over the bar, pairs with a missing return keep their state
+
+        Returns
+        -------
+        pandas series
+            filtered probability of the high volatility regime of each pair
+
+        '''
+        if isinstance(r, (dict, pd.Series)):
+            r = pd.Series(r, dtype = np.float64).reindex(self.pairs)
+        y = np.asarray(r, dtype = np.float64)
+        ok = ~np.isnan(y)
+        y = np.where(ok, y, 0.)
+        par = self.par
+        p11, p22 = par[:, 6], par[:, 7]
+
+        pred = self.xi*p11 + (1 - self.xi)*(1 - p22)
+        s = np.sqrt(self.h)
+        f = np.exp(self.const - .5*(np.abs(y)[:, None]/(s*self.lam))**par[:, 8:10]) / s
+        lik = pred*f[:, 0] + (1 - pred)*f[:, 1]
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            xi = np.where(lik > 0, pred*f[:, 0] / lik, pred)
+        h = par[:, [0, 3]] + par[:, [1, 4]]*(y**2)[:, None] + par[:, [2, 5]]*self.h
+
+        self.xi = np.where(ok, xi, self.xi)
+        self.h = np.where(ok[:, None], h, self.h)
+
+        return pd.Series(1 - self.xi, index = self.pairs)
+
+    @property
+    def probs(self):
+        '''Filtered probabilities of the low and high volatility regimes after the last bar'''
+        return pd.DataFrame({'low': self.xi, 'high': 1 - self.xi}, index = self.pairs)
+
+    @property
+    def sigma(self):
+        '''Volatility forecast of the next bar of each pair'''
+        return pd.Series(np.sqrt(self.forecast(1)[0]), index = self.pairs)
+
+    def forecast(self, steps = 1):
+        '''
+        (steps x pairs) variance forecasts of the next bars, same recursion as msgarch.forecast
+        '''
+        par = self.par
+        p11, p22 = par[:, 6], par[:, 7]
+        pi = self.xi*p11 + (1 - self.xi)*(1 - p22)
+        h = self.h.copy()
+        var = np.empty((steps, len(self.pairs)))
+        for j in range(steps):
+            var[j] = pi*h[:, 0] + (1 - pi)*h[:, 1]
+            h = par[:, [0, 3]] + par[:, [1, 4]]*var[j][:, None] + par[:, [2, 5]]*h
+            pi = pi*p11 + (1 - pi)*(1 - p22)
+
+        return var
+
+    def get_state(self):
+        return {'pairs': list(self.pairs), 'par': self.par.tolist(), 'h': self.h.tolist(), 'xi': self.xi.tolist()}
+
+    def set_state(self, state):
+        self.pairs = list(state['pairs'])
+        self.par = np.array(state['par'], dtype = np.float64)
+        self.h = np.array(state['h'], dtype = np.float64)
+        self.xi = np.array(state['xi'], dtype = np.float64)
+        self._constants()
+
+        return self
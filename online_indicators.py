@@ -0,0 +1,572 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming versions of the technical indicators for live hourly updates
+
+Every indicator keeps its recursive / rolling state and costs O(1) per new bar
+(O(window) for the ring-buffer ones), following the TA-Lib (and pandas for the
+rolling volatility) algorithms operation by operation, so replaying a history
+gives the values of feature_engineering.Indicators.pool bit for bit. The order
+is that of TA-Lib 0.8: RSI multiplies by 1/window, NATR and the MACD EMAs
+smooth with fma(), WILLR clips to [-100, 0] and LINEARREG_SLOPE slides its sums.
+Older TA-Lib builds round a few of these steps differently. Leading NaN bars
+are skipped like TA-Lib does (see benchmarks.bench_online).
+
+Created on Sun Oct 18 16:40:05 2026
+
+@author: Cookie
+"""
+
+import math
+import numpy as np
+import pandas as pd
+
+
+def _is_zero(v):
+    '''TA_IS_ZERO of TA-Lib'''
+    return -0.00000001 < v < 0.00000001
+
+
+def _fma(x, y, z):
+    '''x*y + z rounded once, as C's fma() in the smoothings of TA-Lib 0.8'''
+    if not (math.isfinite(x) and math.isfinite(y) and math.isfinite(z)):
+        return x*y + z
+    # exact over a common power of two denominator, int / int rounds once
+    a, b = x.as_integer_ratio()
+    c, d = y.as_integer_ratio()
+    e, f = z.as_integer_ratio()
+    num = a*c*f + e*b*d
+    try:
+        # an exact zero takes its sign from x*y + z
+        return num / (b*d*f) if num else x*y + z
+    except OverflowError:
+        return x*y + z
+
+
+if hasattr(math, 'fma'):
+    # Python 3.13 and later
+    _fma = math.fma
+
+
+def _true_range(high, low, prev_close):
+    '''TRUE_RANGE of TA-Lib'''
+    tr = high - low
+    if abs(high - prev_close) > tr:
+        tr = abs(high - prev_close)
+    if abs(low - prev_close) > tr:
+        tr = abs(low - prev_close)
+
+    return tr
+
+
+class OnlineIndicator:
+    '''
+    Base class of the streaming indicators
+
+    The state is the instance's plain attributes (floats, ints and lists),
+    so get_state() is JSON / pickle friendly.
+    '''
+    fields = ['close']
+    started = False
+
+    def update(self, bar):
+        '''
+        Add one bar and return the new indicator value, NaN while warming up
+
+        Bars with a NaN field are skipped until the first complete one, as
+        TA-Lib starts at the first index where no input is NaN. Later NaN bars
+        go through the arithmetic like in TA-Lib.
+
+        Parameters
+        ----------
+        bar : dictionary or pandas series
+            the new bar, with at least the fields of the indicator
+
+        '''
+        if not self.started:
+            if any(bar[f] != bar[f] for f in self.fields):
+                return math.nan
+            self.started = True
+
+        return self._update(bar)
+
+    def _update(self, bar):
+        raise NotImplementedError
+
+    def replay(self, data):
+        '''
+        Feed a whole history bar by bar
+
+        Parameters
+        ----------
+        data : pandas dataframe
+            OHLCV bars
+
+        Returns
+        -------
+        numpy array
+            indicator value after every bar
+
+        '''
+        cols = {f: data[f].to_numpy(dtype = np.float64).tolist() for f in self.fields}
+        out = np.empty(data.shape[0])
+        for i in range(data.shape[0]):
+            out[i] = self.update({f: cols[f][i] for f in self.fields})
+
+        return out
+
+    def get_state(self):
+        return {k: list(v) if isinstance(v, list) else v for k, v in vars(self).items()}
+
+    def set_state(self, state):
+        missing = [k for k in vars(self) if k not in state]
+        if missing:
+            raise ValueError(f'state without {missing}, saved by an older version.')
+        for k, v in state.items():
+            setattr(self, k, list(v) if isinstance(v, list) else v)
+
+        return self
+
+
+class OnlineRSI(OnlineIndicator):
+    '''Relative Strength Index, Wilder smoothing seeded with the simple average'''
+    def __init__(self, window = 14):
+        self.window = window
+        self.n = 0
+        self.prev = math.nan
+        self.gain = 0.
+        self.loss = 0.
+
+    def _update(self, bar):
+        close = bar['close']
+        self.n += 1
+        if self.n == 1:
+            self.prev = close
+            return math.nan
+
+        diff = close - self.prev
+        self.prev = close
+        gain = diff if diff > 0. else 0.
+        loss = gain - diff
+        inv = 1.0/self.window
+        if self.n <= self.window + 1:
+            # accumulate the initial period
+            self.gain += gain
+            self.loss += loss
+            if self.n < self.window + 1:
+                return math.nan
+            self.gain *= inv
+            self.loss *= inv
+        else:
+            self.gain = (self.gain*(self.window - 1) + gain)*inv
+            self.loss = (self.loss*(self.window - 1) + loss)*inv
+
+        total = self.gain + self.loss
+        return 100.0*(self.gain/total) if total > 0. else 0.0
+
+
+class OnlineADX(OnlineIndicator):
+    '''Average Directional Index'''
+    fields = ['high', 'low', 'close']
+
+    def __init__(self, window = 14):
+        self.window = window
+        self.n = 0
+        self.prev_high = math.nan
+        self.prev_low = math.nan
+        self.prev_close = math.nan
+        self.plus_dm = 0.
+        self.minus_dm = 0.
+        self.tr = 0.
+        self.sum_dx = 0.
+        self.adx = math.nan
+
+    def _dx(self):
+        '''DX of the smoothed DM / TR, None when undefined'''
+        if _is_zero(self.tr):
+            return None
+        minus_di = 100.0*(self.minus_dm/self.tr)
+        plus_di = 100.0*(self.plus_dm/self.tr)
+        total = minus_di + plus_di
+        if _is_zero(total):
+            return None
+
+        return 100.0*(abs(minus_di - plus_di)/total)
+
+    def _update(self, bar):
+        high, low, close = bar['high'], bar['low'], bar['close']
+        n = self.window
+        self.n += 1
+        if self.n == 1:
+            self.prev_high, self.prev_low, self.prev_close = high, low, close
+            return math.nan
+
+        diff_p = high - self.prev_high
+        diff_m = self.prev_low - low
+        self.prev_high, self.prev_low = high, low
+        tr = _true_range(high, low, self.prev_close)
+        self.prev_close = close
+
+        if self.n > n:
+            # Wilder smoothing once the first n-1 bars are summed up
+            self.minus_dm -= self.minus_dm/n
+            self.plus_dm -= self.plus_dm/n
+        if diff_m > 0 and diff_p < diff_m:
+            self.minus_dm += diff_m
+        elif diff_p > 0 and diff_p > diff_m:
+            self.plus_dm += diff_p
+        if self.n > n:
+            self.tr = self.tr - (self.tr/n) + tr
+        else:
+            self.tr += tr
+            return math.nan
+
+        dx = self._dx()
+        if self.n <= 2*n:
+            # the first ADX is the average of the first n DX
+            if dx is not None:
+                self.sum_dx += dx
+            if self.n < 2*n:
+                return math.nan
+            self.adx = self.sum_dx / n
+        elif dx is not None:
+            self.adx = ((self.adx*(n-1)) + dx)/n
+
+        return self.adx
+
+
+class OnlineNATR(OnlineIndicator):
+    '''Normalized Average True Range'''
+    fields = ['high', 'low', 'close']
+
+    def __init__(self, window = 14):
+        self.window = window
+        self.n = 0
+        self.prev_close = math.nan
+        self.atr = 0.
+
+    def _update(self, bar):
+        high, low, close = bar['high'], bar['low'], bar['close']
+        self.n += 1
+        if self.n == 1:
+            self.prev_close = close
+            return math.nan
+
+        tr = _true_range(high, low, self.prev_close)
+        self.prev_close = close
+        if self.n <= self.window + 1:
+            self.atr += tr
+            if self.n < self.window + 1:
+                return math.nan
+            self.atr = self.atr / self.window
+        else:
+            decay = float(self.window - 1)/self.window
+            self.atr = _fma(self.atr, decay, tr*(1.0 - decay))
+
+        return (self.atr/close)*100.0 if close != 0.0 else 0.0
+
+
+class OnlineMACD(OnlineIndicator):
+    '''MACD histogram
+
+    As in TA-Lib, the slow EMA is seeded with the average of the first `slow`
+    closes and the fast EMA with the average of the last `fast` of them.
+    '''
+    def __init__(self, fast = 12, slow = 26, signal = 9):
+        if slow < fast:
+            fast, slow = slow, fast
+        self.fast = fast
+        self.slow = slow
+        self.signal = signal
+        self.k_fast = 2.0/(fast + 1)
+        self.k_slow = 2.0/(slow + 1)
+        self.k_signal = 2.0/(signal + 1)
+        self.n = 0
+        self.seed = []
+        self.ema_fast = math.nan
+        self.ema_slow = math.nan
+        self.macd = []
+        self.ema_signal = math.nan
+
+    def _update(self, bar):
+        close = bar['close']
+        self.n += 1
+        if self.n <= self.slow:
+            self.seed.append(close)
+            if self.n < self.slow:
+                return math.nan
+            total = 0.0
+            for v in self.seed:
+                total += v
+            self.ema_slow = total / self.slow
+            total = 0.0
+            for v in self.seed[self.slow - self.fast:]:
+                total += v
+            self.ema_fast = total / self.fast
+            self.seed = []
+        else:
+            self.ema_fast = _fma(close - self.ema_fast, self.k_fast, self.ema_fast)
+            self.ema_slow = _fma(close - self.ema_slow, self.k_slow, self.ema_slow)
+
+        macd = self.ema_fast - self.ema_slow
+        if len(self.macd) < self.signal:
+            self.macd.append(macd)
+            if len(self.macd) < self.signal:
+                return math.nan
+            total = 0.0
+            for v in self.macd:
+                total += v
+            self.ema_signal = total / self.signal
+        else:
+            self.ema_signal = _fma(macd - self.ema_signal, self.k_signal, self.ema_signal)
+
+        return macd - self.ema_signal
+
+
+class OnlineCCI(OnlineIndicator):
+    '''Commodity Channel Index on a ring buffer of typical prices'''
+    fields = ['high', 'low', 'close']
+
+    def __init__(self, window = 14):
+        self.window = window
+        self.buffer = [0.] * window
+        self.idx = 0
+        self.n = 0
+
+    def _update(self, bar):
+        last = (bar['high'] + bar['low'] + bar['close'])/3
+        self.buffer[self.idx] = last
+        self.idx = (self.idx + 1) % self.window
+        self.n += 1
+        if self.n < self.window:
+            return math.nan
+
+        # sums run in buffer order, as TA-Lib does
+        average = 0.
+        for v in self.buffer:
+            average += v
+        average /= self.window
+        deviation = 0.
+        for v in self.buffer:
+            deviation += abs(v - average)
+
+        diff = last - average
+        return diff/(0.015*(deviation/self.window)) if diff != 0.0 and deviation != 0.0 else 0.0
+
+
+class OnlineWILLR(OnlineIndicator):
+    '''William's %R on ring buffers of highs and lows'''
+    fields = ['high', 'low', 'close']
+
+    def __init__(self, window = 14):
+        self.window = window
+        self.highs = []
+        self.lows = []
+
+    def _update(self, bar):
+        self.highs.append(bar['high'])
+        self.lows.append(bar['low'])
+        if len(self.highs) > self.window:
+            del self.highs[0], self.lows[0]
+        if len(self.highs) < self.window:
+            return math.nan
+
+        highest, lowest = max(self.highs), min(self.lows)
+        diff = highest - lowest
+        if (abs(highest) + abs(lowest))*1e-14 >= abs(diff):
+            return 0.0
+        willr = ((highest - bar['close'])/diff)*-100.0
+        # clipped to [-100, 0]
+        return 0.0 if willr > 0. else (-100.0 if -100.0 > willr else willr)
+
+
+class OnlineOBV(OnlineIndicator):
+    '''On-balance-volume'''
+    fields = ['close', 'volume']
+
+    def __init__(self):
+        self.obv = math.nan
+        self.prev = math.nan
+
+    def _update(self, bar):
+        close, volume = bar['close'], bar['volume']
+        if self.obv != self.obv:
+            self.obv, self.prev = volume, close
+            return self.obv
+
+        if close > self.prev:
+            self.obv += volume
+        elif close < self.prev:
+            self.obv -= volume
+        self.prev = close
+
+        return self.obv
+
+
+class OnlineLinRegSlope(OnlineIndicator):
+    '''Linear regression slope on a ring buffer of closes
+
+    As in TA-Lib 0.8, the sums slide with the window and are recomputed from
+    the buffer every 32 windows, or sooner when the dropped close is large
+    against the window (cancellation).
+    '''
+    def __init__(self, window = 14):
+        self.window = window
+        self.closes = []
+        self.sum_x = window * (window - 1) * 0.5
+        self.divisor = self.sum_x * self.sum_x - window * float(window * (window - 1) * (2 * window - 1) // 6)
+        self.sum_y = 0.
+        self.sum_abs = 0.
+        self.sum_xy = 0.
+        self.countdown = 0
+
+    def _sums(self):
+        '''Sums of the full buffer, oldest close weighted window - 1'''
+        self.sum_y, self.sum_abs, self.sum_xy = 0., 0., 0.
+        x = float(self.window - 1)
+        for v in self.closes:
+            self.sum_y += v
+            self.sum_abs += abs(v)
+            self.sum_xy += x * v
+            x -= 1.0
+        self.countdown = 32 * self.window
+
+    def _update(self, bar):
+        close = bar['close']
+        self.closes.append(close)
+        if len(self.closes) < self.window:
+            return math.nan
+        if len(self.closes) == self.window:
+            self._sums()
+        else:
+            old = self.closes.pop(0)
+            self.countdown -= 1
+            if self.countdown:
+                self.sum_abs = (self.sum_abs - abs(old)) + abs(close)
+            if not self.countdown or abs(self.window * old) > self.sum_abs * 100.0:
+                self._sums()
+            else:
+                self.sum_xy = (self.sum_xy + self.sum_y) - self.window * old
+                self.sum_y = (self.sum_y - old) + close
+
+        return (self.window * self.sum_xy - self.sum_x * self.sum_y) / self.divisor
+
+
+class OnlineMOM(OnlineIndicator):
+    '''Momentum, close.pct_change(window)'''
+    def __init__(self, window = 10):
+        self.window = window
+        self.closes = []
+
+    def _update(self, bar):
+        self.closes.append(bar['close'])
+        if len(self.closes) <= self.window:
+            return math.nan
+
+        return self.closes[-1] / self.closes.pop(0) - 1
+
+
+class OnlineVol(OnlineIndicator):
+    '''Rolling volatility, close.rolling(window).std()
+
+    Welford updates with Kahan compensation as in pandas' rolling variance,
+    so the values match the batch output bit for bit.
+    '''
+    def __init__(self, window = 5, nbdev = 1):
+        self.window = window
+        self.nbdev = nbdev
+        self.closes = []
+        self.nobs = 0
+        self.mean = 0.
+        self.ssqdm = 0.
+        self.comp_add = 0.
+        self.comp_remove = 0.
+        self.same = 0
+        self.prev = math.nan
+
+    def _add(self, val):
+        self.nobs += 1
+        if val == self.prev:
+            self.same += 1
+        else:
+            self.same = 1
+        self.prev = val
+        prev_mean = self.mean - self.comp_add
+        y = val - self.comp_add
+        t = y - self.mean
+        self.comp_add = t + self.mean - y
+        self.mean = self.mean + t / self.nobs
+        self.ssqdm = self.ssqdm + (val - prev_mean) * (val - self.mean)
+
+    def _remove(self, val):
+        self.nobs -= 1
+        if self.nobs:
+            prev_mean = self.mean - self.comp_remove
+            y = val - self.comp_remove
+            t = y - self.mean
+            self.comp_remove = t + self.mean - y
+            self.mean = self.mean - t / self.nobs
+            self.ssqdm = self.ssqdm - (val - prev_mean) * (val - self.mean)
+        else:
+            self.mean = 0.
+            self.ssqdm = 0.
+
+    def _update(self, bar):
+        close = bar['close']
+        if not self.closes:
+            self.prev = close
+            self.same = 0
+        self.closes.append(close)
+        if len(self.closes) > self.window:
+            self._remove(self.closes.pop(0))
+        self._add(close)
+        if self.nobs < self.window or self.nobs <= 1:
+            return math.nan
+
+        var = 0. if self.same >= self.nobs else self.ssqdm / (self.nobs - 1)
+        return math.sqrt(var) * self.nbdev if var >= 0 else 0.
+
+
+class OnlineIndicators:
+    '''
+    Streaming counterpart of Indicators.pool for the indicators of Indicators.TAdict
+    that have a recursive or rolling form
+    '''
+    TAonline = {'ADX': OnlineADX, 'CCI': OnlineCCI, 'MACD': OnlineMACD, 'MOM': OnlineMOM,
+                'RSI': OnlineRSI, 'WILLR': OnlineWILLR, 'OBV': OnlineOBV, 'ATR': OnlineNATR,
+                'Regression': OnlineLinRegSlope, 'Volatility': OnlineVol}
+
+    def __init__(self, params):
+        '''
+        params: dictionary
+            contains the names of indicators and their parameters, as for Indicators.pool
+        '''
+        self.params = params
+        self.indicators = {ta: self.TAonline[ta](**params[ta]) for ta in params}
+
+    def _update(self, bar):
+        '''
+        Add one bar to every indicator
+
+        Returns
+        -------
+        numpy array
+            latest values, in the order of params
+
+        '''
+        return np.array([ind.update(bar) for ind in self.indicators.values()])
+
+    def replay(self, data):
+        '''
+        Feed a history bar by bar, the output has the layout of Indicators.pool
+        '''
+        return pd.DataFrame({ta: ind.replay(data) for ta, ind in self.indicators.items()},
+                            index = data.index, columns = list(self.params.keys()))
+
+    def get_state(self):
+        return {ta: ind.get_state() for ta, ind in self.indicators.items()}
+
+    def set_state(self, state):
+        for ta, ind in self.indicators.items():
+            ind.set_state(state[ta])
+
+        return self
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Parameter sweeps over the whole strategy, as a DAG of memoized stages
+
+load -> cusumFilter -> Indicators.pool -> RF fit/predict -> signals -> mvp weights -> backtest
+
+Every stage output is keyed by the hash of the configuration entries the stage
+reads and of the keys of its inputs, so a sweep only recomputes the stages
+downstream of what changed: changing the signal band never rebuilds features or
+retrains forests. Stages run in waves of the topological order and the distinct
+tasks of a wave, across stages and configurations, run in a process pool.
+
+Created on Mon Oct 19 14:02:51 2026
+
+@author: Cookie
+"""
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from data_sampler import data_manager
+from feature_engineering import Indicators
+from random_forest import random_forest, compiled_forest
+from portfolio_optimizer import portfolio_optimizer
+from backtester import backtester
+from signals import rolling_bands
+import profiler
+
+# settings of the backtest notebook
+DEFAULTS = {'datadir': r"D:\Career\Quant\My_Research\Markov_Switching_Portfolio\cryptodatadownload",
+            'pairs': "BTCUSD ETHUSD BATUSD FILUSD MKRUSD UNIUSD ZRXUSD",
+            'model_start': '2020-11-01', 'model_end': '2021-08-31',
+            'bt_start': '2021-09-01', 'bt_end': '2021-12-31',
+            'threshold': 0.02,
+            'params': {'ADX': {'window': 10}, 'CCI': {'window': 10}, 'MACD': {'fast': 12, 'slow': 26, 'signal': 9},
+                       'MOM': {'window': 5}, 'RSI': {'window': 10}, 'WILLR': {'window': 10}, 'OBV': {},
+                       'Regression': {'window': 10}, 'Volatility': {'window': 5, 'nbdev': 1}},
+            'split_date': '2021-05-01', 'rf': {},
+            'band_window': 10, 'band': 1.,
+            'rebalance': 'W', 'solver': 'active_set',
+            'fee': 0., 'integer_positions': True}
+
+
+def _closes(data):
+    return data.reset_index(level=0).pivot(columns='level_0', values='close')
+
+
+def _load(cfg):
+    dm = data_manager(cfg['datadir'])
+    data_model = dm.readPair(pairs = cfg['pairs'], start = cfg['model_start'], end = cfg['model_end'])
+    data_bt = dm.readPair(pairs = cfg['pairs'], start = cfg['bt_start'], end = cfg['bt_end'])
+
+    return data_model, data_bt
+
+
+def _samples(cfg, load):
+    return data_manager().cusumFilter(_closes(load[0]).pct_change().dropna(), h = cfg['threshold'])
+
+
+def _features(cfg, load):
+    '''Differenced indicators of every ticker, not yet sampled'''
+    data_model, data_bt = load
+    modelTA, btTA = {}, {}
+    for ticker in data_model.index.get_level_values(0).unique():
+        with profiler.asset(ticker):
+            modelTA[ticker] = Indicators().pool(data_model.loc[ticker], params = cfg['params']).diff()
+            btTA[ticker] = Indicators().pool(data_bt.loc[ticker], params = cfg['params']).diff()
+
+    return modelTA, pd.concat(btTA, axis = 0).dropna()
+
+
+def _dataset(cfg, load, samples, features):
+    '''CUSUM-sampled features with the next bar return as target'''
+    data_model = load[0]
+    modelTA = {}
+    for ticker, ta in features[0].items():
+        modelTA[ticker] = ta.loc[samples[ticker]]
+        modelTA[ticker]['Return'] = data_model.close.loc[ticker].pct_change().shift(-1).loc[samples[ticker]]
+
+    return pd.concat(modelTA, axis = 0).dropna()
+
+
+def _model(cfg, dataset):
+    train = dataset.index.get_level_values(1) < cfg['split_date']
+
+    return random_forest().one_fold_RF(dataset.loc[train].iloc[:, :-1], dataset.loc[train, 'Return'], **cfg['rf'])
+
+
+def _predict(cfg, model, features):
+    '''(time x pair) predicted returns over the backtest period'''
+    return compiled_forest(model).predict_panel(features[1])
+
+
+def _realized(load, predict):
+    return _closes(load[1]).pct_change().align(predict, join = 'right')[0]
+
+
+def _bands(cfg, predict, load):
+    '''Rolling moments of the realized returns, shared by every band'''
+    return rolling_bands(cfg['band_window']).fit(_realized(load, predict))
+
+
+def _signals(cfg, bands, predict):
+    '''Long above rollmean + band * rollstd, short below rollmean - band * rollstd, held until the next signal'''
+    return bands.signals(predict, cfg['band'])
+
+
+def _weights(cfg, predict, load):
+    '''Minimum-variance weights of every rebalance period, held until the next one'''
+    realR = _realized(load, predict)
+    opt = portfolio_optimizer(solver = cfg['solver'])
+    dates, covs = opt.getCovPath(realR, freq = cfg['rebalance'])
+    weights = pd.DataFrame(opt.mvp_batch(covs), index = dates, columns = realR.columns)
+
+    return weights.resample('D').ffill().align(predict, join = 'right', axis = 0)[0].ffill()
+
+
+def _portfolio(cfg, weights, signals):
+    return weights.mul(signals).shift().dropna()
+
+
+def _backtest(cfg, portfolio, load):
+    price = _closes(load[1])
+
+    return backtester(fee = cfg['fee'], integer_positions = cfg['integer_positions']) \
+        .run(portfolio, price.loc[portfolio.index])
+
+
+def _stageTask(args):
+    '''
+    Run one stage, module level so that process workers can run it
+    '''
+    func, cfg, inputs = args
+    t0 = time.perf_counter()
+    with profiler.stage(f"pipeline.{func.__name__.strip('_')}"):
+        out = func(cfg, *inputs)
+
+    return out, time.perf_counter() - t0
+
+
+class pipeline:
+    '''
+    DAG of memoized stages, run over one or many configurations
+    '''
+    def __init__(self, cachedir = None, workers = None):
+        '''
+        Parameters
+        ----------
+        cachedir : str
+            directory of pickled stage outputs shared between runs, default: memory only
+        workers : int
+            size of the process pool, default: stages run one after the other
+        '''
+        self.cachedir = cachedir
+        self.workers = workers
+        self.stages = {}
+        self.memo = {}
+        # (stage, key, seconds) of every stage actually computed
+        self.log = []
+        if cachedir is not None:
+            os.makedirs(cachedir, exist_ok = True)
+
+    @classmethod
+    def crypto(cls, cachedir = None, workers = None):
+        '''
+        The pipeline of the backtest notebook, configurations default to DEFAULTS
+        '''
+        pipe = cls(cachedir, workers)
+        pipe.add('load', _load, params = ['datadir', 'pairs', 'model_start', 'model_end', 'bt_start', 'bt_end'])
+        pipe.add('samples', _samples, ['load'], ['threshold'])
+        pipe.add('features', _features, ['load'], ['params'])
+        pipe.add('dataset', _dataset, ['load', 'samples', 'features'])
+        pipe.add('model', _model, ['dataset'], ['rf', 'split_date'])
+        pipe.add('predict', _predict, ['model', 'features'])
+        pipe.add('bands', _bands, ['predict', 'load'], ['band_window'])
+        pipe.add('signals', _signals, ['bands', 'predict'], ['band'])
+        pipe.add('weights', _weights, ['predict', 'load'], ['rebalance', 'solver'])
+        pipe.add('portfolio', _portfolio, ['weights', 'signals'])
+        pipe.add('backtest', _backtest, ['portfolio', 'load'], ['fee', 'integer_positions'])
+
+        return pipe
+
+    def add(self, name, func, inputs = (), params = ()):
+        '''
+        Add a stage
+
+        Parameters
+        ----------
+        name : str
+            name of the stage
+        func : function
+            func(cfg, *outputs of inputs), module level to run in process workers
+        inputs : list of str
+            upstream stages, already added
+        params : list of str
+            configuration entries the stage reads
+        '''
+        assert all(i in self.stages for i in inputs), 'inputs must be added first.'
+        self.stages[name] = (func, list(inputs), list(params))
+
+        return self
+
+    def _waves(self):
+        '''Stages grouped by depth in the DAG, each wave only needs the earlier ones'''
+        depth = {}
+        for name, (_, inputs, _) in self.stages.items():
+            depth[name] = 1 + max([depth[i] for i in inputs], default = -1)
+
+        return [[s for s in self.stages if depth[s] == d] for d in range(max(depth.values()) + 1)]
+
+    def _key(self, name, cfg, keys):
+        _, inputs, params = self.stages[name]
+        spec = json.dumps([name, {p: cfg[p] for p in params}, [keys[i] for i in inputs]],
+                          sort_keys = True, default = str)
+
+        return hashlib.sha1(spec.encode()).hexdigest()[:20]
+
+    def _path(self, name, key):
+        return os.path.join(self.cachedir, f"{name}_{key}.pkl")
+
+    def _cached(self, name, key):
+        if key in self.memo:
+            return True
+        if self.cachedir is not None and os.path.exists(self._path(name, key)):
+            try:
+                with open(self._path(name, key), 'rb') as f:
+                    self.memo[key] = pickle.load(f)
+                return True
+            except (pickle.UnpicklingError, EOFError):
+                # left over by an older interrupted run, recomputed
+                return False
+
+        return False
+
+    def run(self, configs, targets = None):
+        '''
+        Run the stages for every configuration, reusing all the outputs already computed
+
+        Parameters
+        ----------
+        configs : dictionary or list of dictionaries
+            configurations, missing entries are taken from DEFAULTS
+        targets : list of str
+            stages to return, default: those no other stage depends on
+
+        Returns
+        -------
+        dictionary, or list of dictionaries
+            stage -> output of each configuration
+
+        '''
+        single = isinstance(configs, dict)
+        configs = [{**DEFAULTS, **c} for c in ([configs] if single else configs)]
+        if targets is None:
+            used = {i for _, inputs, _ in self.stages.values() for i in inputs}
+            targets = [s for s in self.stages if s not in used]
+        keys = [{} for _ in configs]
+
+        # spawned workers, the parent has run numba and BLAS threads a fork would copy mid-state
+        pool = ProcessPoolExecutor(self.workers, mp_context = multiprocessing.get_context('spawn')) \
+            if self.workers is not None and self.workers > 1 else None
+        try:
+            for wave in self._waves():
+                tasks = {}
+                for cfg, k in zip(configs, keys):
+                    for name in wave:
+                        k[name] = key = self._key(name, cfg, k)
+                        if key not in tasks and not self._cached(name, key):
+                            func, inputs, params = self.stages[name]
+                            tasks[key] = (name, (func, {p: cfg[p] for p in params},
+                                                 [self.memo[k[i]] for i in inputs]))
+
+                args = [task for _, task in tasks.values()]
+                results = pool.map(_stageTask, args) if pool is not None and len(args) > 1 else map(_stageTask, args)
+                for (key, (name, _)), (out, seconds) in zip(tasks.items(), results):
+                    self.memo[key] = out
+                    self.log.append((name, key, seconds))
+                    if self.cachedir is not None:
+                        # written aside and renamed, an interrupted run never leaves a truncated file
+                        tmp = f"{self._path(name, key)}.{os.getpid()}.tmp"
+                        with open(tmp, 'wb') as f:
+                            pickle.dump(out, f)
+                        os.replace(tmp, self._path(name, key))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        results = [{name: self.memo[k[name]] for name in targets} for k in keys]
+
+        return results[0] if single else results
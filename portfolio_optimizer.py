@@ -1,98 +1,398 @@
-# -*- coding: utf-8 -*-
-"""
-Portfolio Optimization with CVXPY
-
-Created on Thu Aug  4 20:56:31 2022
-
-@author: Cookie
-"""
-
-import pandas as pd
-import numpy as np
-import cvxpy as cvx
-
-class portfolio_optimizer:
-    def __init__(self, mode = 'MVP'):
-        self.mode = mode        # default: minimum-variance portfolio
-        
-    def getCovMat(self, r):
-        '''
-        Geneate covariance matrix from return series
-
-        Parameters
-        ----------
-        r : TYPE
-            DESCRIPTION.
-
-        Returns
-        -------
-        None.
-
-        '''
-        cov_mat = ((r.std().values.reshape(-1,1) @ r.std().values.reshape(-1,1).T) * r.corr().values)
-        
-        return cov_mat
-        
-    def mvp(self, cov_mat):
-        '''
-        Minimum-Variance Portfolio
-
-        Parameters
-        ----------
-        cov_mat : numpy array
-            covariance matrix
-
-        Returns
-        -------
-        weights:
-            optimal portfolio weights
-
-        '''
-        n = cov_mat.shape[1]
-        x = cvx.Variable(n)
-        
-        objective = cvx.Minimize(cvx.quad_form(x, cov_mat))
-        constraints = [0 <= x, x <= 1, cvx.sum(x) == 1]
-        problem = cvx.Problem(objective, constraints)
-        
-        results = problem.solve()
-        weights = x.value
-        
-        return weights
-    
-    def ERC(self, historical, market):
-        '''
-        Equal Risk Contribution Portfolio
-
-        Parameters
-        ----------
-        historical : pandas dataframe
-            Historical return series
-        market: pandas dataframe
-            Market Portfolio return series
-
-        Returns
-        -------
-        weights:
-            optimal portfolio weights
-
-        '''
-        if historical.shape[0] != market.shape[0]:
-            return "Incompatible data shapes."
-        
-        beta = np.ones(shape = (historical.shape[1]))
-        for i in range(historical.shape[1]):
-            beta[i] = np.polyfit(historical.iloc[:, i], market, deg = 1)[0]
-            
-        weights = 1/beta
-        weights = weights/np.sum(weights)
-        
-        return weights
-        
-
-
-"""For debug
-if __name__ == "__main__":
-    opt = portfolio_optimizer().mvp(cov_mat = np.array([[1, .2, .3], [.2, 1, .25], [.3, .25, 1]]))
-    print(opt)
+# -*- coding: utf-8 -*-
+"""
+Portfolio Optimization with CVXPY, or a NumPy active-set solver
+
+Created on Thu Aug  4 20:56:31 2022
+
+@author: Cookie
+"""
+
+import pandas as pd
+import numpy as np
+
+from profiler import profiled
+# cvxpy is imported by the methods that use it, it is slow to load and
+# the default active-set solver does not need it
+
+
+def _mvp_active_set(cov_mat, jitter = 1e-10, tol = 1e-12, max_iter = None):
+    '''
+    Long-only, fully invested minimum-variance weights by a primal active-set method
+    
+    Starting from equal weights, the weights of the free assets solve the
+    equality-constrained problem Σ_FF w_F = ν1, 1'w_F = 1. A step that would
+    turn weights negative stops at the first one reaching zero and fixes it; an
+    asset at zero whose multiplier (Σw)_i - ν is negative is freed again.
+    0 <= w <= 1 needs no separate upper bound, w >= 0 and sum(w) = 1 imply it.
+    
+    Parameters
+    ----------
+    cov_mat : numpy array
+        covariance matrix
+    jitter : float
+        ridge added to the diagonal, relative to its mean, so near-singular
+        matrices still have a unique solution
+    tol : float
+        tolerance of the optimality check, relative to the mean variance
+    max_iter : int
+        iteration limit, default: 10 times the number of assets
+
+    Returns
+    -------
+    numpy array
+        optimal portfolio weights
+
+    '''
+    cov_mat = np.asarray(cov_mat, dtype = np.float64)
+    n = cov_mat.shape[0]
+    scale = np.trace(cov_mat) / n
+    cov_mat = cov_mat + jitter * scale * np.eye(n)
+    
+    w = np.full(n, 1/n)
+    free = np.ones(n, dtype = bool)
+    for _ in range(max_iter or 10*n):
+        # equality-constrained minimum over the free assets
+        z = np.linalg.solve(cov_mat[np.ix_(free, free)], np.ones(free.sum()))
+        target = np.zeros(n)
+        target[free] = z / z.sum()
+        
+        if (target[free] >= 0).all():
+            w = target
+            mu = cov_mat @ w
+            mu = mu - mu[free].mean()
+            mu[free] = 0
+            i = np.argmin(mu)
+            if mu[i] >= -tol * scale:
+                break
+            free[i] = True
+        else:
+            # walk towards the target until the first weight hits zero
+            shrink = free & (target < w)
+            ratio = np.full(n, np.inf)
+            ratio[shrink] = w[shrink] / (w[shrink] - target[shrink])
+            i = np.argmin(ratio)
+            w = w + ratio[i] * (target - w)
+            w[i] = 0
+            free[i] = False
+            
+    w = np.clip(w, 0, None)
+    
+    return w / w.sum()
+
+
+class portfolio_optimizer:
+    def __init__(self, mode = 'MVP', solver = 'active_set'):
+        '''
+        Parameters
+        ----------
+        mode : str
+            portfolio construction, default: minimum-variance portfolio
+        solver : str
+            'active_set' solves the long-only MVP in NumPy (_mvp_active_set),
+            'cvxpy' builds and solves a new problem on every call,
+            'parametric' compiles one problem per universe size and re-solves
+            it with warm starts, the covariance being a parameter
+        '''
+        self.mode = mode        # default: minimum-variance portfolio
+        self.solver = solver
+        self._problems = {}
+        
+    def getCovMat(self, r, sigma = None):
+        '''
+        Geneate covariance matrix from return series
+
+        Parameters
+        ----------
+        r : TYPE
+            DESCRIPTION.
+        sigma : array
+            forecast volatilities, e.g. from msgarch, replacing the realized ones
+
+        Returns
+        -------
+        None.
+
+        '''
+        std = r.std().values if sigma is None else np.asarray(sigma, dtype = np.float64)
+        cov_mat = r.corr().values * std[:, None] * std[None, :]
+        
+        return cov_mat
+        
+    @profiled('getCovPath', rows = 'r')
+    def getCovPath(self, r, freq = None, window = None, dates = None, method = 'sample', halflife = None,
+                   sigma = None, chunk = 2**22):
+        '''
+        Covariance matrices of every rebalance date in one pass over the bars
+        
+        Per-bar terms (1, x, xx', and for Ledoit-Wolf ||x||^2 and its products)
+        are accumulated chunk by chunk into prefix sums, so each estimate is the
+        difference of two prefix sums and sliding the window costs O(n^2) per bar.
+        EWMA runs the same terms through the recursion S = λS + xx'.
+
+        Parameters
+        ----------
+        r : pandas dataframe
+            (time x assets) return series, rows with missing values are dropped
+        freq : str
+            one estimate per resample(freq) bucket, like
+            r.resample(freq).apply(getCovMat), buckets of less than 2 bars are skipped
+        window : int
+            otherwise, rolling window of bars ending at each of dates
+        dates : list of timestamps
+            dates of the rolling or EWMA estimates, default: every bar
+        method : str
+            'sample' covariance, 'ledoit_wolf' shrinkage to a scaled identity
+            (same as sklearn.covariance.LedoitWolf), or zero-mean 'ewma'
+        halflife : float
+            EWMA halflife in bars
+        sigma : pandas dataframe
+            (time x assets) forecast volatilities, e.g. msgarch sigma_; when
+            given, the estimates only supply the correlations and the
+            volatilities are those of the last bar of each window
+        chunk : int
+            bars x terms processed at a time, bounds the memory
+
+        Returns
+        -------
+        dates : pandas DatetimeIndex
+            dates of the estimates
+        cov_stack : numpy array
+            (dates x assets x assets) covariance matrices
+
+        '''
+        r = r.dropna()
+        X = r.to_numpy(dtype = np.float64)
+        T, n = X.shape
+        
+        if freq is not None:
+            sizes = r.resample(freq).size()
+            ends = np.cumsum(sizes.values)
+            keep = sizes.values > 1
+            dates, ends = sizes.index[keep], ends[keep]
+            starts = ends - sizes.values[keep]
+        else:
+            dates = r.index if dates is None else pd.DatetimeIndex(dates)
+            ends = r.index.searchsorted(dates, side = 'right')
+            starts = np.maximum(ends - (window or T), 0)
+            
+        if method == 'ewma':
+            cov = self._ewmaCov(X, ends, halflife, chunk)
+        else:
+            cov = self._windowCov(X, starts, ends, method == 'ledoit_wolf', chunk)
+            
+        if sigma is not None:
+            std = np.sqrt(np.diagonal(cov, axis1 = 1, axis2 = 2))
+            vol = sigma.reindex(index = r.index, columns = r.columns).to_numpy(dtype = np.float64)[ends - 1]
+            cov = cov * (vol / std)[:, :, None] * (vol / std)[:, None, :]
+            
+        return dates, cov
+    
+    def _windowCov(self, X, starts, ends, lw, chunk):
+        '''
+        Sample or Ledoit-Wolf covariances of the bars in [starts, ends)
+        '''
+        n = X.shape[1]
+        # covariances are shift invariant, centering once limits the cancellation of prefix sums
+        X = X - X.mean(axis = 0)
+        positions = np.unique(np.concatenate([starts, ends]))
+        sums = self._prefixSums(X, positions, lw, chunk)
+        at = lambda p: sums[np.searchsorted(positions, p)]
+        diff = at(ends) - at(starts)
+        
+        m = diff[:, 0]
+        m[m < 2] = np.nan
+        mean = diff[:, 1:n+1] / m[:, None]
+        S2 = diff[:, n+1:n+1+n*n].reshape(-1, n, n)
+        cov = S2 / m[:, None, None] - mean[:, :, None] * mean[:, None, :]
+        
+        if lw:
+            # sum over the window of ||x - mean||^4, from the sums of ||x||^4, ||x||^2 x and xx'
+            Q, Qx = diff[:, n+1+n*n], diff[:, n+2+n*n:]
+            q = np.trace(S2, axis1 = 1, axis2 = 2)
+            mm = (mean**2).sum(axis = 1)
+            m_S1 = (mean * diff[:, 1:n+1]).sum(axis = 1)
+            beta_ = (Q + 4*np.einsum('ti,tij,tj->t', mean, S2, mean) + m*mm**2 - 4*(mean * Qx).sum(axis = 1)
+                     + 2*mm*q - 4*mm*m_S1)
+            
+            mu = np.trace(cov, axis1 = 1, axis2 = 2) / n
+            delta_ = (cov**2).sum(axis = (1, 2))
+            beta = np.minimum((beta_/m - delta_) / (n*m), (delta_ - mu**2*n) / n)
+            delta = (delta_ - mu**2*n) / n
+            shrinkage = np.where(beta == 0, 0, beta / np.where(delta == 0, 1, delta))
+            cov = (1 - shrinkage)[:, None, None] * cov
+            cov[:, np.arange(n), np.arange(n)] += (shrinkage * mu)[:, None]
+        else:
+            cov *= (m / (m - 1))[:, None, None]
+            
+        return cov
+    
+    def _prefixSums(self, X, positions, lw, chunk):
+        '''
+        Sums of the per-bar terms over the bars before each position,
+        as rows of [count, x, xx' (, ||x||^4, ||x||^2 x)]
+        '''
+        T, n = X.shape
+        width = 1 + n + n*n + (1 + n if lw else 0)
+        step = max(1, chunk // width)
+        out = np.zeros((len(positions), width))
+        carry = np.zeros(width)
+        
+        for start in range(0, T, step):
+            x = X[start:start + step]
+            terms = [np.ones((x.shape[0], 1)), x, (x[:, :, None] * x[:, None, :]).reshape(x.shape[0], -1)]
+            if lw:
+                q = (x**2).sum(axis = 1, keepdims = True)
+                terms += [q**2, q*x]
+            csum = np.cumsum(np.hstack(terms), axis = 0) + carry
+            
+            sel = (positions > start) & (positions <= start + x.shape[0])
+            out[sel] = csum[positions[sel] - start - 1]
+            carry = csum[-1]
+        out[positions > T] = carry
+        
+        return out
+    
+    def _ewmaCov(self, X, ends, halflife, chunk):
+        '''
+        Zero-mean EWMA covariance after the first `ends` bars, weights normalized
+        like pandas ewm(halflife, adjust = True) applied to xx'
+        '''
+        T, n = X.shape
+        lam = np.exp(-np.log(2) / halflife)
+        # λ^-k grows within a chunk, bound it to 2^40
+        step = max(1, min(chunk // (1 + n*n), int(40 * halflife)))
+        out = np.full((len(ends), n, n), np.nan)
+        S, W = np.zeros(n*n), 0.
+        
+        for start in range(0, T, step):
+            x = X[start:start + step]
+            k = np.arange(1, x.shape[0] + 1)
+            grow = lam**-k
+            terms = (x[:, :, None] * x[:, None, :]).reshape(x.shape[0], -1)
+            # S_t = λ^t S_0 + sum_s λ^(t-s) xx'_s, within the chunk
+            csum = np.cumsum(terms * grow[:, None], axis = 0) / grow[:, None] + S * (lam**k)[:, None]
+            wsum = np.cumsum(grow) / grow + W * lam**k
+            
+            sel = (ends > start) & (ends <= start + x.shape[0])
+            out[sel] = (csum[ends[sel] - start - 1] / wsum[ends[sel] - start - 1, None]).reshape(-1, n, n)
+            S, W = csum[-1], wsum[-1]
+            
+        return out
+    
+    @profiled('mvp', rows = 'cov_mat')
+    def mvp(self, cov_mat):
+        '''
+        Minimum-Variance Portfolio
+
+        Parameters
+        ----------
+        cov_mat : numpy array
+            covariance matrix
+
+        Returns
+        -------
+        weights:
+            optimal portfolio weights
+
+        '''
+        if self.solver == 'active_set':
+            return _mvp_active_set(cov_mat)
+        if self.solver == 'parametric':
+            return self._mvp_parametric(cov_mat)
+        
+        import cvxpy as cvx
+        n = cov_mat.shape[1]
+        x = cvx.Variable(n)
+        
+        objective = cvx.Minimize(cvx.quad_form(x, cov_mat))
+        constraints = [0 <= x, x <= 1, cvx.sum(x) == 1]
+        problem = cvx.Problem(objective, constraints)
+        
+        results = problem.solve()
+        weights = x.value
+        
+        return weights
+    
+    def _mvp_parametric(self, cov_mat):
+        '''
+        Minimum-variance portfolio from the compiled problem of this universe size
+        
+        The objective is written as ||L'x||^2 with the factor L = V sqrt(D) of
+        cov_mat as a cvx.Parameter, which keeps the problem DPP, so CVXPY
+        canonicalizes it once and later solves only refill the solver data.
+        '''
+        import cvxpy as cvx
+        n = cov_mat.shape[1]
+        if n not in self._problems:
+            x = cvx.Variable(n)
+            L = cvx.Parameter((n, n))
+            problem = cvx.Problem(cvx.Minimize(cvx.sum_squares(L.T @ x)), [0 <= x, x <= 1, cvx.sum(x) == 1])
+            self._problems[n] = (problem, x, L)
+        problem, x, L = self._problems[n]
+        
+        eigval, eigvec = np.linalg.eigh(np.asarray(cov_mat, dtype = np.float64))
+        L.value = eigvec * np.sqrt(np.clip(eigval, 0, None))
+        problem.solve(warm_start = True)
+        
+        return x.value
+    
+    @profiled('mvp_batch', rows = 'cov_stack')
+    def mvp_batch(self, cov_stack):
+        '''
+        Minimum-variance portfolios of a stack of covariance matrices,
+        e.g. one per rebalance date
+
+        Parameters
+        ----------
+        cov_stack : numpy array
+            (dates x assets x assets) covariance matrices
+
+        Returns
+        -------
+        weights : numpy array
+            (dates x assets) optimal portfolio weights
+
+        '''
+        cov_stack = np.asarray(cov_stack, dtype = np.float64)
+        weights = np.empty(cov_stack.shape[:2])
+        for t in range(cov_stack.shape[0]):
+            weights[t] = self.mvp(cov_stack[t])
+            
+        return weights
+    
+    def ERC(self, historical, market):
+        '''
+        Equal Risk Contribution Portfolio
+
+        Parameters
+        ----------
+        historical : pandas dataframe
+            Historical return series
+        market: pandas dataframe
+            Market Portfolio return series
+
+        Returns
+        -------
+        weights:
+            optimal portfolio weights
+
+        '''
+        if historical.shape[0] != market.shape[0]:
+            return "Incompatible data shapes."
+        
+        beta = np.ones(shape = (historical.shape[1]))
+        for i in range(historical.shape[1]):
+            beta[i] = np.polyfit(historical.iloc[:, i], market, deg = 1)[0]
+            
+        weights = 1/beta
+        weights = weights/np.sum(weights)
+        
+        return weights
+        
+
+
+"""For debug
+if __name__ == "__main__":
+    opt = portfolio_optimizer().mvp(cov_mat = np.array([[1, .2, .3], [.2, 1, .25], [.3, .25, 1]]))
+    print(opt)
 """
\ No newline at end of file
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in profiling of the pipeline stages
+
+The hot paths (readPair, cusumFilter, Indicators.pool, one_fold_RF, mvp, the
+backtest and the pipeline stages) are decorated with profiled(). While the
+profiler is off a decorated call only checks one flag. Once enable() is called
+every call records its wall time, CPU time, peak memory (tracemalloc, when
+asked for), process max RSS (Unix only) and the rows it processed, per stage and asset, and
+the nesting of the stages. The records export to JSON or CSV, and the time
+goes out as a cProfile dump or as collapsed stacks that flamegraph.pl and
+speedscope read.
+
+    import profiler
+    profiler.enable(memory = True, cprofile = True)
+    ... run the notebook steps or a pipeline ...
+    profiler.disable()
+    profiler.summary(); profiler.to_csv('profile.csv'); profiler.dump_collapsed('profile.folded')
+
+Calls inside process workers run in other interpreters and are not recorded,
+the parent call that waits for them is.
+
+Created on Mon Oct 19 22:31:08 2026
+
+@author: Cookie
+"""
+
+import json
+import time
+import itertools
+import inspect
+import cProfile
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # resource is Unix only, without it max_rss is not recorded
+    resource = None
+
+
+class _state:
+    enabled = False
+    memory = False
+    cprofile = None
+    records = []
+    ids = itertools.count()
+    local = threading.local()
+
+
+def enable(memory = False, cprofile = False):
+    '''
+    Start recording
+
+    Parameters
+    ----------
+    memory : Boolen
+        trace the peak memory of every stage with tracemalloc, slows allocations down
+    cprofile : Boolen
+        also run cProfile, see dump_stats()
+    '''
+    _state.memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if cprofile:
+        _state.cprofile = cProfile.Profile()
+        _state.cprofile.enable()
+    _state.enabled = True
+
+
+def disable():
+    '''Stop recording, the records are kept until reset()'''
+    _state.enabled = False
+    if _state.cprofile is not None:
+        _state.cprofile.disable()
+    if _state.memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled():
+    return _state.enabled
+
+
+def reset():
+    '''Drop the records and the cProfile data'''
+    _state.records = []
+    _state.cprofile = None
+
+
+def _stack():
+    if not hasattr(_state.local, 'stack'):
+        _state.local.stack = []
+        _state.local.asset = None
+
+    return _state.local.stack
+
+
+@contextmanager
+def asset(name):
+    '''
+    Asset of the stages opened inside, for the ones whose arguments do not name it
+    '''
+    if not _state.enabled:
+        yield
+        return
+    _stack()
+    previous, _state.local.asset = _state.local.asset, name
+    try:
+        yield
+    finally:
+        _state.local.asset = previous
+
+
+@contextmanager
+def stage(name, asset = None, rows = None):
+    '''
+    Record a block of code as a stage
+
+    Parameters
+    ----------
+    name : str
+        name of the stage
+    asset : str
+        asset of the stage, default: the one set by asset()
+    rows : int
+        rows processed, can also be set on the yielded record
+
+    '''
+    if not _state.enabled:
+        yield {}
+        return
+
+    stack = _stack()
+    record = {'id': next(_state.ids), 'parent': stack[-1]['id'] if stack else None,
+              'stage': name, 'asset': asset if asset is not None else _state.local.asset,
+              'path': ';'.join([s['stage'] for s in stack] + [name]), 'rows': rows,
+              'peak_bytes': np.nan, 'thread': threading.get_ident()}
+    if _state.memory:
+        # fold the peak so far into the open stages before it is reset for this one
+        current, peak = tracemalloc.get_traced_memory()
+        for s in stack:
+            s['_peak'] = max(s['_peak'], peak)
+        tracemalloc.reset_peak()
+        record['_base'], record['_peak'] = current, current
+    stack.append(record)
+    record['start'] = time.time()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record['wall'] = time.perf_counter() - wall
+        record['cpu'] = time.process_time() - cpu
+        stack.pop()
+        if _state.memory and tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            for s in stack:
+                s['_peak'] = max(s['_peak'], peak)
+            record['peak_bytes'] = max(record['_peak'], peak) - record['_base']
+        record.pop('_base', None)
+        record.pop('_peak', None)
+        # ru_maxrss is in KB on Linux
+        record['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource is not None \
+            else np.nan
+        _state.records.append(record)
+
+
+def _count(x):
+    shape = getattr(x, 'shape', None)
+    if shape is not None and len(shape):
+        return int(shape[0])
+    try:
+        return len(x)
+    except TypeError:
+        return None
+
+
+def profiled(name, asset = None, rows = None):
+    '''
+    Decorator recording every call of a function as a stage
+
+    Parameters
+    ----------
+    name : str
+        name of the stage
+    asset : str
+        argument naming the asset, e.g. 'pair'
+    rows : str or function
+        argument whose length is the number of rows processed, or rows(result),
+        default: length of the result
+    '''
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+
+            by_name = isinstance(rows, str)
+            arguments = signature.bind(*args, **kwargs).arguments if asset is not None or by_name else {}
+            with stage(name, asset = arguments.get(asset)) as record:
+                if by_name:
+                    record['rows'] = _count(arguments.get(rows))
+                out = func(*args, **kwargs)
+                if not by_name:
+                    record['rows'] = _count(out) if rows is None else rows(out)
+
+            return out
+
+        return wrapper
+
+    return decorator
+
+
+def records():
+    '''
+    Every recorded call
+
+    Returns
+    -------
+    pandas dataframe
+        id, parent, stage, asset, path, rows, start (epoch seconds), wall and
+        cpu (seconds), peak_bytes, max_rss and thread
+
+    '''
+    columns = ['id', 'parent', 'stage', 'asset', 'path', 'rows', 'start', 'wall', 'cpu', 'peak_bytes',
+               'max_rss', 'thread']
+
+    return pd.DataFrame(_state.records, columns = columns).sort_values('id', ignore_index = True)
+
+
+def summary(by = ('stage', 'asset')):
+    '''
+    Calls, total and mean wall time, CPU time, max peak memory, rows and rows per second
+    '''
+    rec = records()
+    g = rec.groupby(list(by), dropna = False, sort = False)
+    out = pd.DataFrame({'calls': g.size(), 'wall': g['wall'].sum(), 'mean_wall': g['wall'].mean(),
+                        'cpu': g['cpu'].sum(), 'peak_bytes': g['peak_bytes'].max(),
+                        'rows': g['rows'].sum(min_count = 1)})
+    out['rows_per_s'] = out['rows'] / out['wall']
+
+    return out.sort_values('wall', ascending = False)
+
+
+def to_json(path):
+    '''Write the records as a json list'''
+    with open(path, 'w') as f:
+        json.dump(json.loads(records().to_json(orient = 'records')), f, indent = 1)
+
+
+def to_csv(path):
+    '''Write the records as csv'''
+    records().to_csv(path, index = False)
+
+
+def dump_stats(path):
+    '''
+    Write the cProfile data of enable(cprofile = True), for pstats, snakeviz or gprof2dot
+    '''
+    assert _state.cprofile is not None, 'enable(cprofile = True) first.'
+    _state.cprofile.dump_stats(path)
+
+
+def dump_collapsed(path):
+    '''
+    Write the stage stacks in the collapsed format of flamegraph.pl and speedscope,
+    one "stage;nested stage microseconds" line per stack, self time only
+    '''
+    rec = records()
+    children = rec.groupby('parent')['wall'].sum()
+    rec['self'] = rec['wall'] - rec['id'].map(children).fillna(0)
+    # stacks per asset keep the assets apart in the graph
+    path_ = np.where(rec['asset'].notna(), rec['path'] + '[' + rec['asset'].astype(str) + ']', rec['path'])
+    micro = rec.groupby(path_, sort = False)['self'].sum().mul(1e6).round().clip(lower = 0).astype(np.int64)
+    with open(path, 'w') as f:
+        for stack, us in micro.items():
+            f.write(f"{stack} {us}\n")
@@ -1,116 +1,544 @@
-# -*- coding: utf-8 -*-
-"""
-Random Forest Regressor for Ensembling Indicators
-
-Created on Sat Jul 23 16:16:55 2022
-
-@author: Cookie
-"""
-
-import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import GridSearchCV
-from tqdm import tqdm
-
-class random_forest:
-    def one_fold_RF(self, indicators, returns, **kwargs):
-        '''
-        One-fold training
-
-        Parameters
-        ----------
-        indicators : TYPE
-            DESCRIPTION.
-        returns : TYPE
-            DESCRIPTION.
-        **kwargs : TYPE
-            DESCRIPTION.
-
-        Returns
-        -------
-        regr : TYPE
-            DESCRIPTION.
-
-        '''
-        assert indicators.shape[0] == returns.shape[0], 'incompatile shapes.'
-        
-        RF = RandomForestRegressor(kwargs)
-        regr = RF.fit(indicators, returns)
-        
-        return regr
-    
-    def rolling_RF(self, indicators, returns, window, train, test, opt = False, **kwargs):
-        '''
-        Rolling training and testing
-
-        Parameters
-        ----------
-        indicators : TYPE
-            DESCRIPTION.
-        returns : TYPE
-            DESCRIPTION.
-        window : TYPE
-            DESCRIPTION.
-        **kwargs : TYPE
-            DESCRIPTION.
-
-        Returns
-        -------
-        RandomForestRegressor object
-
-        '''
-        assert indicators.shape[0] == returns.shape[0], 'incompatile shapes.'
-        
-        n = np.ceiling(returns.shape[0]/window)
-        pred_y = []
-        for i in tqdm(range(n-1), 'Rolling Random Forest...'):
-            training_x = indicators.iloc[(i)*window: (train+i)*window]
-            training_y = returns.iloc[(i)*window: (train+i)*window]
-            testing_x = indicators.iloc[(i+train)*window: min((i+train+test)*window, indicators.shape[0])]
-            
-            RF_i = self.one_fold_RF(training_x, training_y, kwargs)
-            y_i = RF_i.predict(testing_x)
-            pred_y.append(y_i)
-            
-        pred_y = pd.Series(np.vstack(pred_y), index = indicators.index[window:], name = 'prediction')
-        
-        return pred_y
-    
-    def optimize_RF(self, indicators, returns, params, cv, **kwargs):
-        '''
-        Optimize in-sample Random Forest Parameters
-
-        Parameters
-        ----------
-        indicators : TYPE
-            DESCRIPTION.
-        returns : TYPE
-            DESCRIPTION.
-        params : TYPE
-            DESCRIPTION.
-        cv : TYPE
-            DESCRIPTION.
-        **kwargs : TYPE
-            DESCRIPTION.
-
-        Returns
-        -------
-        None.
-
-        '''
-        assert indicators.shape[0] == returns.shape[0], 'incompatile shapes.'
-        
-        n = indicators.shape[0]
-        train_idx = list(range(cv))
-        valid_idx = list(range(cv, n))
-        custom_cv = zip(train_idx, valid_idx)
-        
-        search = GridSearchCV(RandomForestRegressor, param_grid = params, cv = custom_cv, **kwargs)
-        res_search = search.fit(indicators, returns)
-        
-        return res_search
-        
-        
-        
-            
+# -*- coding: utf-8 -*-
+"""
+Random Forest Regressor for Ensembling Indicators
+
+Created on Sat Jul 23 16:16:55 2022
+
+@author: Cookie
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+from contextlib import nullcontext
+import numpy as np
+import pandas as pd
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import ParameterGrid
+from sklearn.metrics import r2_score
+from tqdm import tqdm
+
+from profiler import profiled
+# without numba compiled_forest falls back to a vectorized NumPy traversal
+from compute import njit
+
+
+def _foldTask(args):
+    '''
+    Fit and predict one walk-forward fold
+    
+    The feature matrix is either the array itself or the (path, shape) of a
+    read-only memmap, so process workers map the same file instead of
+    receiving a pickled copy for every fold.
+    '''
+    X, y, train_rows, test_rows, kwargs = args
+    X = _loadFeatures(X)
+    
+    RF = RandomForestRegressor(**kwargs)
+    RF.fit(X[train_rows[0]:train_rows[1]], y[train_rows[0]:train_rows[1]])
+    
+    return RF.predict(X[test_rows[0]:test_rows[1]])
+
+
+def _shareFeatures(X, tmpdir):
+    '''
+    Write the float32 feature matrix to a memmap in tmpdir, returns its (path, shape)
+    '''
+    path = os.path.join(tmpdir, 'features.dat')
+    mm = np.memmap(path, dtype = np.float32, mode = 'w+', shape = X.shape)
+    mm[:] = X
+    mm.flush()
+    del mm
+    
+    return (path, X.shape)
+
+
+def _loadFeatures(X):
+    '''Inverse of _shareFeatures, arrays are passed through'''
+    if isinstance(X, tuple):
+        return np.memmap(X[0], dtype = np.float32, mode = 'r', shape = X[1])
+    
+    return X
+
+
+def _scoreTask(args):
+    '''
+    Fit one candidate on one fold and return its out-of-sample R2
+    '''
+    X, y, train_idx, test_idx, params = args
+    X = _loadFeatures(X)
+    
+    RF = RandomForestRegressor(**params).fit(X[train_idx], y[train_idx])
+    
+    return r2_score(y[test_idx], RF.predict(X[test_idx]))
+
+
+# one node of the compiled kernel, packed like sklearn's so a visit touches one cache line
+_NODE = np.dtype([('left', np.int32), ('right', np.int32), ('feature', np.int32), ('missing_right', np.int32),
+                  ('threshold', np.float64)])
+
+
+def _forest_predict(X, nodes, value, roots):
+    '''
+    Mean leaf value over the trees for every row, trees summed in order as sklearn does
+    
+    One tree at a time, so its nodes stay in cache, every row descends only
+    until it reaches a leaf (a node that is its own child). Serial on purpose:
+    numba's parallel threading layers do not survive a later fork of the process
+    pools. NaN features follow sklearn's missing_go_to_left.
+    '''
+    n = X.shape[0]
+    out = np.zeros(n)
+    for root in roots:
+        for i in range(n):
+            node = root
+            while nodes[node].left != node:
+                nd = nodes[node]
+                x = X[i, nd.feature]
+                if x != x:
+                    node = nd.right if nd.missing_right else nd.left
+                elif x > nd.threshold:
+                    node = nd.right
+                else:
+                    node = nd.left
+            out[i] += value[node]
+        
+    return out / len(roots)
+
+
+if njit is not None:
+    _forest_predict = njit(cache = True)(_forest_predict)
+
+
+class purged_walk_forward:
+    '''
+    Walk-forward splits for labels that span time, such as the CUSUM-sampled
+    next-bar returns of several pairs stacked together
+    
+    The sample times are cut into n_splits + 1 consecutive periods; fold k tests
+    on period k + 1 and trains on everything before it, minus the samples whose
+    label ends after the test period starts (purging) or within `embargo` of it.
+    
+    Reference:
+    APA. Lopez de Prado, M. (2018). Advances in financial machine learning, 105-109
+    '''
+    def __init__(self, n_splits = 5, horizon = '1h', embargo = '0h'):
+        '''
+        Parameters
+        ----------
+        n_splits : int
+            number of folds
+        horizon : str or pandas Timedelta
+            time spanned by a label after its sample time
+        embargo : str or pandas Timedelta
+            extra gap between the end of the training labels and the test period
+        '''
+        self.n_splits = n_splits
+        self.horizon = pd.Timedelta(horizon)
+        self.embargo = pd.Timedelta(embargo)
+        
+    def get_n_splits(self, X = None, y = None, groups = None):
+        return self.n_splits
+    
+    def split(self, X, y = None, groups = None):
+        '''
+        Yields train and test positions; X is indexed by date or by (pair, date)
+        '''
+        times = pd.DatetimeIndex(X.index.get_level_values(-1))
+        bounds = np.unique(times.values)
+        edges = bounds[np.linspace(0, len(bounds), self.n_splits + 2).astype(int)[:-1]]
+        t1 = times + self.horizon
+        
+        for k in range(1, self.n_splits + 1):
+            start = edges[k]
+            end = edges[k + 1] if k + 1 < len(edges) else None
+            test = times >= start if end is None else (times >= start) & (times < end)
+            train = (times < start) & (t1 < start - self.embargo)
+            yield np.flatnonzero(train), np.flatnonzero(test)
+
+
+class tree_pool:
+    '''
+    Trees grown per chunk of rows, for incremental walk-forward retraining
+    
+    Every chunk of the training window owns a small forest, sized by its share
+    of the window and fitted on the whole window as it was when the chunk
+    entered. Moving the window forward only grows the trees of the chunks that
+    entered and retires the trees of the chunks that left.
+    '''
+    def __init__(self, n_estimators = 100, random_state = None, **kwargs):
+        self.n_estimators = n_estimators
+        self.random_state = random_state
+        self.kwargs = kwargs
+        self.forests = {}
+        
+    def update(self, X, y, chunks):
+        '''
+        Make the pool cover exactly the given chunks
+
+        Parameters
+        ----------
+        X, y : numpy arrays
+            features and targets
+        chunks : list of (start, end)
+            row ranges of the training window
+
+        Returns
+        -------
+        int
+            number of chunks fitted in this update
+
+        '''
+        total = sum(end - start for start, end in chunks)
+        first, last = min(start for start, _ in chunks), max(end for _, end in chunks)
+        for chunk in list(self.forests):
+            if chunk not in chunks:
+                del self.forests[chunk]
+                
+        fitted = 0
+        for start, end in chunks:
+            if (start, end) in self.forests:
+                continue
+            k = max(1, int(round(self.n_estimators * (end - start) / total)))
+            seed = None if self.random_state is None else self.random_state + start
+            self.forests[start, end] = RandomForestRegressor(n_estimators = k, random_state = seed, 
+                                                             **self.kwargs).fit(X[first:last], y[first:last])
+            fitted += 1
+            
+        return fitted
+    
+    def predict(self, X):
+        '''
+        Average over all trees of the pool
+        '''
+        pred = np.zeros(X.shape[0])
+        trees = 0
+        for forest in self.forests.values():
+            pred += forest.predict(X) * forest.n_estimators
+            trees += forest.n_estimators
+            
+        return pred / trees
+
+
+class compiled_forest:
+    '''
+    Fitted forest flattened into array-backed node tables for batch scoring
+    
+    All trees live in one set of node arrays, the (left, right) children of
+    node i at 2i and 2i + 1 and leaves pointing to themselves. With numba a
+    compiled kernel walks every row down each tree to its leaf, tree by tree;
+    without it, all (tree, row) pairs descend together in vectorized NumPy. NaN features go where sklearn sends them (missing_go_to_left).
+    '''
+    def __init__(self, model, chunk = 8192):
+        '''
+        Parameters
+        ----------
+        model : RandomForestRegressor or tree_pool
+            fitted forest, e.g. from random_forest.one_fold_RF
+        chunk : int
+            rows scored at a time by the NumPy traversal, bounds its (trees x rows) work arrays
+        '''
+        if isinstance(model, tree_pool):
+            estimators = [tree for forest in model.forests.values() for tree in forest.estimators_]
+        else:
+            estimators = model.estimators_
+        self.feature_names = list(getattr(model, 'feature_names_in_', []))
+        self.chunk = chunk
+        
+        feature, threshold, missing_right, children, value, roots = [], [], [], [], [], []
+        offset = 0
+        for est in estimators:
+            tree = est.tree_
+            nodes = np.arange(tree.node_count)
+            leaf = tree.children_left == -1
+            feature.append(np.where(leaf, 0, tree.feature))
+            threshold.append(np.where(leaf, np.inf, tree.threshold))
+            # where sklearn sends NaN features
+            missing_right.append(~np.asarray(getattr(tree, 'missing_go_to_left', np.ones(tree.node_count)), dtype = bool))
+            children.append(np.column_stack([np.where(leaf, nodes, tree.children_left),
+                                             np.where(leaf, nodes, tree.children_right)]).ravel() + offset)
+            value.append(tree.value[:, 0, 0])
+            roots.append(offset)
+            offset += tree.node_count
+            
+        self.feature = np.concatenate(feature).astype(np.intp)
+        self.threshold = np.concatenate(threshold)
+        self.missing_right = np.concatenate(missing_right)
+        self.children = np.concatenate(children).astype(np.intp)
+        self.value = np.concatenate(value)
+        self.roots = np.array(roots, dtype = np.intp)
+        
+        self.nodes = np.empty(len(self.feature), dtype = _NODE)
+        self.nodes['left'], self.nodes['right'] = self.children[0::2], self.children[1::2]
+        self.nodes['feature'] = self.feature
+        self.nodes['missing_right'] = self.missing_right
+        self.nodes['threshold'] = self.threshold
+        
+    def _leaves(self, X):
+        '''(trees x rows) leaf nodes of a float64 feature block'''
+        n, k = X.shape
+        X = X.ravel()
+        nodes = np.repeat(self.roots, n)
+        offset = np.tile(np.arange(n)*k, len(self.roots))
+        # (tree, row) pairs still above a leaf, compacted level by level
+        active = np.flatnonzero(self.children[2*nodes] != nodes)
+        while active.size:
+            node = nodes[active]
+            x = X[offset[active] + self.feature[node]]
+            right = np.where(np.isnan(x), self.missing_right[node], x > self.threshold[node])
+            node = self.children[2*node + right]
+            nodes[active] = node
+            active = active[self.children[2*node] != node]
+            
+        return nodes.reshape(len(self.roots), n)
+    
+    def predict(self, X):
+        '''
+        Same predictions as the sklearn forest
+
+        Parameters
+        ----------
+        X : numpy array or pandas dataframe
+            features, in the column order used for fitting
+
+        Returns
+        -------
+        numpy array
+
+        '''
+        if isinstance(X, pd.DataFrame) and self.feature_names:
+            X = X[self.feature_names]
+        # sklearn compares float32 features with float64 thresholds
+        X = np.asarray(X, dtype = np.float32).astype(np.float64)
+        
+        if njit is not None:
+            return _forest_predict(X, self.nodes, self.value, self.roots)
+        
+        pred = np.empty(X.shape[0])
+        for start in range(0, X.shape[0], self.chunk):
+            leaves = self.value[self._leaves(X[start:start + self.chunk])]
+            # summed tree by tree, in the same order as sklearn
+            total = np.zeros(leaves.shape[1])
+            for tree in leaves:
+                total += tree
+            pred[start:start + self.chunk] = total / leaves.shape[0]
+            
+        return pred
+    
+    def predict_panel(self, X):
+        '''
+        Score a stacked (pair, date) feature frame for all pairs at once
+        
+        Returns the (time x pair) dataframe that
+        reset_index(level = 0).pivot(columns = 'level_0', ...) would give.
+        '''
+        index = X.index.remove_unused_levels()
+        out = np.full((len(index.levels[1]), len(index.levels[0])), np.nan)
+        out[index.codes[1], index.codes[0]] = self.predict(X)
+        
+        return pd.DataFrame(out, index = index.levels[1], columns = index.levels[0], copy = False)
+
+
+class random_forest:
+    @profiled('one_fold_RF', rows = 'indicators')
+    def one_fold_RF(self, indicators, returns, **kwargs):
+        '''
+        One-fold training
+
+        Parameters
+        ----------
+        indicators : TYPE
+            DESCRIPTION.
+        returns : TYPE
+            DESCRIPTION.
+        **kwargs : TYPE
+            DESCRIPTION.
+
+        Returns
+        -------
+        regr : TYPE
+            DESCRIPTION.
+
+        '''
+        assert indicators.shape[0] == returns.shape[0], 'incompatile shapes.'
+        
+        RF = RandomForestRegressor(**kwargs)
+        regr = RF.fit(indicators, returns)
+        
+        return regr
+    
+    def rolling_RF(self, indicators, returns, window, train, test, opt = False, workers = None, 
+                   incremental = False, **kwargs):
+        '''
+        Rolling training and testing
+        
+        The data is cut into blocks of `window` rows. Each fold trains on `train`
+        blocks and predicts the next `test` blocks, then the folds move forward by
+        `test` blocks, so the test blocks tile the out-of-sample period.
+
+        Parameters
+        ----------
+        indicators : pandas dataframe
+            features, in time order
+        returns : pandas series
+            targets
+        window : int
+            rows per block
+        train : int
+            number of blocks in a training window
+        test : int
+            number of blocks predicted by each fold
+        workers : int
+            number of folds fitted concurrently in a process pool, None or 1 fits them one by one
+        incremental : Boolen
+            keep a tree_pool across folds and only grow trees on the blocks that
+            entered the training window; folds then run one after another
+        **kwargs :
+            parameters of RandomForestRegressor
+
+        Returns
+        -------
+        pred_y : pandas series
+            out-of-sample predictions, indexed like indicators.index[train*window:]
+
+        '''
+        assert indicators.shape[0] == returns.shape[0], 'incompatile shapes.'
+        
+        n = indicators.shape[0]
+        folds = []
+        start = 0
+        while start + train*window < n:
+            folds.append(((start, start + train*window), 
+                          (start + train*window, min(start + (train+test)*window, n))))
+            start += test*window
+            
+        # sklearn fits forests on float32, so nothing is lost by sharing it in float32
+        X = np.ascontiguousarray(indicators.to_numpy(dtype = np.float32))
+        y = returns.to_numpy(dtype = np.float64)
+        
+        if incremental:
+            pool = tree_pool(**kwargs)
+            pred_y = []
+            for tr, te in tqdm(folds, 'Incremental Random Forest...'):
+                # chunks of `test` blocks, aligned on the end of the training window
+                chunks = [(max(tr[0], end - test*window), end) for end in range(tr[1], tr[0], -test*window)]
+                pool.update(X, y, chunks[::-1])
+                pred_y.append(pool.predict(X[te[0]:te[1]]))
+        elif workers is None or workers <= 1 or len(folds) <= 1:
+            pred_y = [_foldTask((X, y, tr, te, kwargs)) for tr, te in tqdm(folds, 'Rolling Random Forest...')]
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                shared = _shareFeatures(X, tmp)
+                tasks = [(shared, y, tr, te, kwargs) for tr, te in folds]
+                with ProcessPoolExecutor(max_workers = min(workers, len(folds))) as ex:
+                    # map keeps the fold order, so the predictions line up with the index
+                    pred_y = list(tqdm(ex.map(_foldTask, tasks), 'Rolling Random Forest...', total = len(folds)))
+            
+        pred_y = pd.Series(np.concatenate(pred_y) if pred_y else np.array([]), 
+                           index = indicators.index[train*window:], name = 'prediction')
+        
+        return pred_y
+    
+    def optimize_RF(self, indicators, returns, params, cv, workers = None, cachedir = None, factor = 3,
+                    horizon = '1h', embargo = '0h', **kwargs):
+        '''
+        Optimize in-sample Random Forest Parameters
+        
+        Successive halving over purged walk-forward folds: every candidate is
+        scored on the most recent folds first, only the best 1/factor move on
+        to more folds. (candidate, fold) scores are memoized in cachedir, so an
+        interrupted search resumes where it stopped.
+
+        Parameters
+        ----------
+        indicators : pandas dataframe
+            features, indexed by date or by (pair, date)
+        returns : pandas series
+            targets
+        params : dictionary
+            parameter grid of RandomForestRegressor
+        cv : int
+            number of walk-forward folds
+        workers : int
+            number of fits run concurrently in a process pool
+        cachedir : str
+            directory for the memoized fold scores, None disables it
+        factor : int
+            share of candidates dropped at each rung is 1 - 1/factor
+        horizon, embargo :
+            see purged_walk_forward
+        **kwargs :
+            fixed parameters of RandomForestRegressor
+
+        Returns
+        -------
+        res_search : namespace
+            best_params_, best_score_, best_estimator_ refitted on all data,
+            and cv_results_ with the mean R2 and the number of folds per candidate
+
+        '''
+        assert indicators.shape[0] == returns.shape[0], 'incompatile shapes.'
+        
+        X = np.ascontiguousarray(indicators.to_numpy(dtype = np.float32))
+        y = returns.to_numpy(dtype = np.float64)
+        folds = list(purged_walk_forward(cv, horizon, embargo).split(indicators))
+        candidates = [dict(kwargs, **c) for c in ParameterGrid(params)]
+        
+        data_key = hashlib.sha1(X.tobytes() + y.tobytes()).hexdigest()
+        if cachedir is not None:
+            os.makedirs(cachedir, exist_ok = True)
+        def cache_path(c, k):
+            key = json.dumps([data_key, cv, str(horizon), str(embargo), k, c], sort_keys = True, default = str)
+            return os.path.join(cachedir, hashlib.sha1(key.encode()).hexdigest()[:24] + '.json')
+        
+        scores = {}
+        alive = list(range(len(candidates)))
+        rungs = int(np.ceil(np.log(len(candidates)) / np.log(factor))) if len(candidates) > 1 else 0
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            shared = _shareFeatures(X, tmp) if workers is not None and workers > 1 else X
+            for rung in range(rungs + 1):
+                n_folds = cv if rung == rungs else max(1, int(np.ceil(cv / factor**(rungs - rung))))
+                # most recent folds first, they have the most training data
+                todo = [(c, k) for c in alive for k in range(cv - n_folds, cv) if (c, k) not in scores]
+                for c, k in list(todo):
+                    if cachedir is not None and os.path.exists(cache_path(candidates[c], k)):
+                        try:
+                            with open(cache_path(candidates[c], k)) as f:
+                                scores[c, k] = json.load(f)['score']
+                        except ValueError:
+                            # truncated by an older interrupted search, the fold is scored again
+                            continue
+                        todo.remove((c, k))
+                        
+                tasks = [(shared, y, folds[k][0], folds[k][1], candidates[c]) for c, k in todo]
+                parallel = workers is not None and workers > 1
+                with ProcessPoolExecutor(max_workers = workers) if parallel else nullcontext() as ex:
+                    results = ex.map(_scoreTask, tasks) if parallel else map(_scoreTask, tasks)
+                    # scores are written as they arrive, so an interrupted rung keeps its finished fits
+                    for (c, k), score in tqdm(zip(todo, results), f'Rung {rung}...', total = len(todo)):
+                        scores[c, k] = score
+                        if cachedir is not None:
+                            # written aside and renamed, an interrupted search never leaves a truncated file
+                            path = cache_path(candidates[c], k)
+                            with open(path + '.tmp', 'w') as f:
+                                json.dump({'params': candidates[c], 'fold': k, 'score': score}, f, default = str)
+                            os.replace(path + '.tmp', path)
+                            
+                mean = {c: np.mean([scores[c, k] for k in range(cv - n_folds, cv)]) for c in alive}
+                if rung < rungs:
+                    alive = sorted(alive, key = lambda c: -mean[c])[:max(1, int(np.ceil(len(alive) / factor)))]
+                    
+        results = pd.DataFrame([{'params': candidates[c], 
+                                 'mean_score': np.mean([v for (cc, _), v in scores.items() if cc == c]),
+                                 'n_folds': sum(cc == c for cc, _ in scores)} for c in range(len(candidates))])
+        best = max(alive, key = lambda c: mean[c])
+        
+        res_search = SimpleNamespace(best_params_ = candidates[best], best_score_ = mean[best],
+                                     best_estimator_ = self.one_fold_RF(indicators, returns, **candidates[best]),
+                                     cv_results_ = results)
+        
+        return res_search
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Screening of indicators over tickers and parameter grids
+
+Every (ticker, indicator, params) combination gets band signals and the trade
+statistics of test_indicators. Bars come from the local cache of data_manager,
+one task per (ticker, indicator) evaluates all the parameters of the indicator
+as one panel, and the rows are written out as soon as each task is done.
+
+Created on Mon Oct 19 16:40:05 2026
+
+@author: Cookie
+"""
+
+import os
+import json
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+from scipy.stats import skew, kurtosis
+
+from data_sampler import data_manager
+from feature_engineering import Indicators
+from test_indicators import trade_table, holding_returns
+
+try:
+    import pyarrow as pa
+except ImportError:
+    # pyarrow is optional, without it the results are streamed to a csv file
+    pa = None
+
+
+# bars already read by this process, the tasks of one pair follow each other
+_bars = {}
+
+
+def band_signals(ind, window = 10, band = 1.):
+    '''
+    Long above rollmean + band * rollstd of the indicator, short below
+    rollmean - band * rollstd, held until the next signal, like the backtest notebook
+
+    Parameters
+    ----------
+    ind : pandas dataframe
+        (time x params) indicator values
+
+    Returns
+    -------
+    pandas dataframe
+        positions composed of only 1, 0, -1
+
+    '''
+    rollmean = ind.rolling(window).mean()
+    rollstd = ind.rolling(window).std()
+    signals = (ind > rollmean + band*rollstd).astype(np.float64) - (ind < rollmean - band*rollstd)
+
+    return signals.replace(0, np.nan).ffill().fillna(0)
+
+
+def _readBars(datadir, cachedir, pair, start, end):
+    key = (datadir, cachedir, pair, start, end)
+    if key not in _bars:
+        _bars.clear()
+        _bars[key] = data_manager(datadir, cachedir).readPair(pair, start, end).loc[pair]
+
+    return _bars[key]
+
+
+def _screenTask(args):
+    '''
+    All the parameters of one indicator on one pair, module level so that process workers can run it
+    '''
+    datadir, cachedir, pair, start, end, ta, params, signal, signal_kwargs, periods = args
+    data = _readBars(datadir, cachedir, pair, start, end)
+
+    indicators = Indicators()
+    ind = pd.DataFrame(np.column_stack([indicators.pool(data, {ta: p})[ta].to_numpy(dtype = np.float64)
+                                        for p in params]), index = data.index)
+    # positions taken at the close of a bar earn the next bar
+    pos = signal(ind, **signal_kwargs).shift().fillna(0)
+    R = pos.mul(data.close.pct_change(), axis = 0).fillna(0)
+
+    details = trade_table(pos, R)
+    column = details.index.get_level_values(0).to_numpy()
+    g = details['return'].groupby(column)
+    k = len(params)
+    rows = {'trades': np.bincount(column, minlength = k),
+            'long': np.bincount(column, details['type'] > 0, minlength = k).astype(np.int64)}
+    rows['short'] = rows['trades'] - rows['long']
+    # same moments as trade_summary
+    for name, stat in [('mean', g.mean()), ('median', g.median()), ('stddev', g.std()), ('skewness', g.agg(skew)),
+                       ('kurtosis', g.agg(kurtosis)), ('hit_rate', g.agg(lambda x: (x > 0).mean()))]:
+        rows[name] = stat.reindex(range(k)).to_numpy(dtype = np.float64)
+
+    periods_year = pd.Timedelta('365D') / pd.Series(data.index).diff().median()
+    rows['total_return'] = np.expm1(np.log1p(R).sum().to_numpy())
+    rows['sharpe'] = (R.mean() / R.std() * np.sqrt(periods_year)).to_numpy()
+    if len(periods):
+        hold = holding_returns(pos, R, periods).groupby(level = 0).mean().reindex(range(k))
+        for p in periods:
+            rows[f'hold_{p}'] = hold[p].to_numpy()
+
+    return rows
+
+
+class indicator_screen:
+    '''
+    Band-signal trade statistics of every (ticker, indicator, params) combination
+    '''
+    def __init__(self, datadir = r"D:\Career\Quant\My_Research\Markov_Switching_Portfolio\cryptodatadownload",
+                 cachedir = None, workers = None, signal = band_signals, signal_kwargs = None, periods = (1, 6, 24)):
+        '''
+        Parameters
+        ----------
+        datadir : str
+            directory of the hourly csv files, read through the data_manager cache
+        cachedir : str
+            cache directory of data_manager, next to the data by default
+        workers : int
+            size of the process pool, None or 1 runs the tasks one by one
+        signal : function
+            signal(indicators, **signal_kwargs) -> positions, module level to run in process workers
+        signal_kwargs : dictionary
+            parameters of the signal rule, none by default
+        periods : list of int
+            holding periods after every entry, in bars
+        '''
+        self.datadir = datadir
+        self.cachedir = cachedir
+        self.workers = workers
+        self.signal = signal
+        self.signal_kwargs = signal_kwargs or {}
+        self.periods = list(periods)
+
+    def grid(self, grid):
+        '''
+        Expand parameter ranges
+
+        Parameters
+        ----------
+        grid : dictionary
+            indicator name of Indicators.TAdict -> {parameter: list of values},
+            e.g. {'RSI': {'window': [5, 10, 14]}, 'OBV': {}}
+
+        Returns
+        -------
+        list of (indicator, list of parameter dictionaries)
+
+        '''
+        TAdict = Indicators().TAdict
+        assert all(ta in TAdict for ta in grid), 'indicators must be in Indicators.TAdict.'
+
+        return [(ta, [dict(zip(ranges, values)) for values in itertools.product(*ranges.values())])
+                for ta, ranges in grid.items()]
+
+    def run(self, pairs, start, end, grid, out = None):
+        '''
+        Screen every combination
+
+        Parameters
+        ----------
+        pairs : str
+            A string contains all the pairs.
+        start: str
+            start date
+        end: str
+            end date
+        grid : dictionary
+            same as grid()
+        out : str
+            file the rows are streamed to as the tasks finish, an arrow ipc file
+            (read with pyarrow.feather.read_table) or a csv file without pyarrow
+
+        Returns
+        -------
+        pandas dataframe
+            one row per combination: pair, indicator, params (json) and the statistics
+
+        '''
+        tasks = [(self.datadir, self.cachedir, pair, start, end, ta, params, self.signal, self.signal_kwargs,
+                  self.periods) for pair in pairs.split(' ') for ta, params in self.grid(grid)]
+
+        if self.workers is None or self.workers <= 1 or len(tasks) == 1:
+            pool = None
+            results = map(_screenTask, tasks)
+        else:
+            pool = ProcessPoolExecutor(max_workers = min(self.workers, len(tasks)))
+            # map keeps the task order, so the table is deterministic
+            results = pool.map(_screenTask, tasks)
+
+        columns = {}
+        writer = None
+        try:
+            for task, rows in tqdm(zip(tasks, results), 'Screening...', total = len(tasks)):
+                _, _, pair, _, _, ta, params = task[:7]
+                chunk = {'pair': [pair] * len(params), 'indicator': [ta] * len(params),
+                         'params': [json.dumps(p, sort_keys = True) for p in params], **rows}
+                for c, v in chunk.items():
+                    columns.setdefault(c, []).append(v)
+                if out is not None:
+                    writer = self._write(out, chunk, writer)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if writer is not None and pa is not None:
+                writer.close()
+
+        table = pd.DataFrame({c: np.concatenate(v) for c, v in columns.items()})
+        for c in ['pair', 'indicator']:
+            table[c] = table[c].astype('category')
+
+        return table
+
+    def _write(self, out, chunk, writer):
+        '''
+        Append the rows of one task to the results file
+        '''
+        if pa is None:
+            pd.DataFrame(chunk).to_csv(out, mode = 'w' if writer is None else 'a', header = writer is None,
+                                       index = False)
+            return True
+
+        batch = pa.RecordBatch.from_pydict({c: np.asarray(v) for c, v in chunk.items()})
+        if writer is None:
+            os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok = True)
+            writer = pa.ipc.new_file(out, batch.schema)
+        writer.write_batch(batch)
+
+        return writer
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Band signals of predicted against realized returns
+
+Long when the prediction is above rollmean + band * rollstd of the realized
+returns, short below rollmean - band * rollstd, held until the next signal.
+The rolling moments are computed once, then any number of band multipliers
+are evaluated together as a (band x time x pair) cube.
+
+Created on Mon Oct 19 18:21:36 2026
+
+@author: Cookie
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class rolling_bands:
+    '''
+    Rolling moments of the realized returns and the signals of any band multipliers
+    '''
+    def __init__(self, window = 10):
+        '''
+        Parameters
+        ----------
+        window : int
+            rolling window of the mean and standard deviation, 10 in the notebook
+        '''
+        self.window = window
+        self.index = None
+        self.columns = None
+        self.mean = None
+        self.std = None
+
+    def fit(self, realR):
+        '''
+        Compute the rolling moments once
+
+        Parameters
+        ----------
+        realR : pandas dataframe
+            (time x pair) realized returns, aligned with the predictions
+
+        '''
+        rolling = realR.rolling(self.window)
+        self.index = realR.index
+        self.columns = realR.columns
+        self.mean = rolling.mean().to_numpy(dtype = np.float64)
+        self.std = rolling.std().to_numpy(dtype = np.float64)
+
+        return self
+
+    def cube(self, pred, bands):
+        '''
+        Signals of every band multiplier in one broadcasted pass
+
+        Parameters
+        ----------
+        pred : pandas dataframe or numpy array
+            (time x pair) predicted returns, same shape as the fitted returns
+        bands : list of float
+            band multipliers
+
+        Returns
+        -------
+        numpy array
+            (band x time x pair) signals composed of 1, -1, nan before the first signal
+
+        '''
+        P = pred.to_numpy(dtype = np.float64) if isinstance(pred, pd.DataFrame) else np.asarray(pred, dtype = np.float64)
+        assert P.shape == self.mean.shape, 'pred must have the shape of the fitted returns.'
+        bands = np.asarray(bands, dtype = np.float64).reshape(-1, 1, 1)
+
+        width = bands * self.std
+        S = (P > self.mean + width).astype(np.int8)
+        S -= P < self.mean - width
+
+        # forward fill: position of the last signal at or before every bar
+        last = np.where(S != 0, np.arange(S.shape[1]).reshape(1, -1, 1), 0)
+        np.maximum.accumulate(last, axis = 1, out = last)
+        cube = np.take_along_axis(S, last, axis = 1).astype(np.float64)
+        # only bars before the first signal are still 0
+        cube[cube == 0] = np.nan
+
+        return cube
+
+    def signals(self, pred, band = 1.):
+        '''
+        Signals of one band multiplier, same as the notebook's
+
+        signals_date = (np.where(pred > rollmean + rollstd, 1, 0) + np.where(pred < rollmean - rollstd, -1, 0))
+                       .replace(0, np.nan).ffill()
+
+        Returns
+        -------
+        pandas dataframe
+            (time x pair) signals
+
+        '''
+        return pd.DataFrame(self.cube(pred, [band])[0], index = self.index, columns = self.columns)
+
+    def frames(self, pred, bands):
+        '''
+        Signals of every band multiplier as dataframes
+
+        Returns
+        -------
+        dictionary
+            band -> (time x pair) signals
+
+        '''
+        cube = self.cube(pred, bands)
+
+        return {b: pd.DataFrame(cube[k], index = self.index, columns = self.columns) for k, b in enumerate(bands)}
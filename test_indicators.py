@@ -1,216 +1,316 @@
-# -*- coding: utf-8 -*-
-"""
-Module for testing indicators
-
-Created on Tue Jul 19 22:12:14 2022
-
-@author: Cookie
-"""
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import yfinance as yf
-from scipy.stats import skew, kurtosis
-
-sns.set_style('darkgrid')
-
-class TestIndicators:
-    def __init__(self, ticker, **kwargs):
-        '''
-        Initialize the class
-        '''
-        # set up parameters for the indicator
-        self.params = {}
-        self.params.update(kwargs)
-        # test on single ticker
-        assert type(ticker) == str, 'Wrong Type of Ticker.'
-        self.ticker = ticker
-        self.data = None
-        self.indicator = None
-        self.signals = None
-        self.returns = None
-    
-    def read_data(self, interval, start_date, end_date):
-        '''
-        get data from Yahoo! Finance
-        '''
-        tic = yf.Ticker(self.ticker)
-        data = tic.history(interval, start_date, end_date)
-        
-        return data
-    
-    def indicator_series(self):
-        '''
-        Over write this function to generate indicator series
-
-        Parameters
-        ----------
-        data : TYPE
-            DESCRIPTION.
-
-        Returns
-        -------
-        None.
-        
-
-        '''
-        return
-    
-    def indicator_signals(self, indicator):
-        '''
-        Generate signals for this indicator
-
-        Parameters
-        ----------
-        indicator : TYPE
-            DESCRIPTION.
-
-        Returns
-        -------
-        signals: pd.Series
-            composed of only 1, 0, -1
-
-        '''
-        
-        return
-    
-    def signals_return(self, signals, start, end, mid = False, log = False):
-        '''
-        Calculate returns
-
-        Parameters
-        ----------
-        signals : TYPE
-            DESCRIPTION.
-        log: Boolen
-            whether to calculate log return
-        mid : Boolen
-            whether to use mid price of the bar for return
-
-        Returns
-        -------
-        r: pd.Series
-            the return series
-        
-        '''
-        if not self.data:
-            return 'No data to calculate.'
-        
-        if mid:
-            use_data = self.data.close.add(self.data.open).div(2).loc[start:end]
-        else:
-            use_data = self.data.close.loc[start:end]
-            
-        if log:
-            r = np.log(self.data.close).diff()
-        else:
-            r = self.data.close.pct_change()
-            
-        r = signals.loc[start:end].mul(r)
-        self.returns = r
-        
-        return r
-    
-    def trades_stats(self, start, end, mid = False, log = False):
-        '''
-        Calculate trades statistics
-
-        Returns
-        -------
-        statistics of trades
-
-        '''
-        if not self.signals:
-            return 'No signals.'
-        
-        recalculate = False
-        if not self.returns:
-            recalculate = True
-        elif (self.returns.index[0].strftime("%Y-%m-%d")!=start) | (self.returns.index[-1].strftime("%Y-%m-%d")!=end):
-            recalculate = True
-            
-        if recalculate:
-            r = self.signals_return(self.signals, start, end, mid = False, log = False)
-            self.returns = r
-            
-        signal_diff = self.signals.diff()
-        trades = signal_diff.where(signal_diff==0, self.signals).to_frame(name = 'trades')
-        trades = trades.where(trades!=0)
-        trades['label'] = np.nan
-        trades['return'] = self.returns()
-        trades.loc[trades.trades!=0] = trades.index.to_array()
-        trade_type = trades.groupby('label')['trades'].mean()
-        trade_return = trades.groupby('label')['return'].apply(lambda x: x.add(1).cumprod().sub(1).iloc[-1])
-        trades_detail = pd.concat([trade_type, trade_return], axis = 1)
-        trades_detail.columns = ['type', 'return']
-        trades_detail['number'] = np.array(list(range(1, trades_detail.shape[0]+1)))
-        
-        stats = pd.DataFrame(index = ['mean', 'median', 'stddev', 'skewness', 'kurtosis'], 
-                             columns = ['short', 'long'])
-        stats.loc['mean'] = trades_detail.groupby('type')['return'].mean()
-        stats.loc['median'] = trades_detail.groupby('type')['return'].median()
-        stats.loc['stddev'] = trades_detail.groupby('type')['return'].std()
-        stats.loc['skewness'] = trades_detail.groupby('type')['return'].apply(lambda x: skew(x))
-        stats.loc['kurtosis'] = trades_detail.groupby('type')['return'].apply(lambda x: kurtosis(x))
-        
-        return {'statistics': stats, 
-                'details': trades_detail,
-                'time_series': trades}
-    
-    def return_distribution(self, start, end, mid = False, log = False):
-        '''
-        Visulize the distribution of return for each hypothetical trade
-        
-        start:
-            start of the testing period
-        end:
-            end of the testing period
-        Returns
-        -------
-        statistics of trades 
-
-        '''
-        stats = self.trade_stats(start, end, mid, log)['statistics']
-        
-        fig, ax = plt.subplots(figsize = (20, 10))
-        sns.displot(x = 'return', hue = 'type', data = stats, ax = ax)
-        ax.set_title('Return distribution per trades', fontsize = 15)
-        
-        return stats
-    
-    def return_beanplot(self, periods, start, end, mid = False, log = False):
-        '''
-        Visuzlize the return distribution
-        with different holding periods
-
-        Returns
-        -------
-        None.
-
-        '''
-        trade_stats = self.trade_stats(start, end, mid, log)
-        details = trade_stats['details']
-        ts = trade_stats['time_series']
-        
-        all_returns = []
-        
-        for period in periods:
-            if log:
-                return_p = ts['return'].rolling(period).sum().shift(-period).loc[details.index]
-            else:
-                return_p = ts['return'].rolling(period).apply(lambda x: x.add(1).cumprod().sub(1).iloc[-1]).shift(-period).loc[details.index]
-            return_p = return_p.to_frame(name = 'return')
-            return_p['period'] = period
-            return_p['type'] = details['type']
-            
-            all_returns.append(return_p)
-            
-        fig, ax = plt.subplots(figsize = (20, 10))
-        sns.violinplot(x = 'period', y = 'return', hue = 'type', data = all_returns, ax = ax)
-        ax.set_title('Return distribution in periods')
-        
-        return
-    
-        
-        
+# -*- coding: utf-8 -*-
+"""
+Module for testing indicators
+
+Created on Tue Jul 19 22:12:14 2022
+
+@author: Cookie
+"""
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import seaborn as sns
+from scipy.stats import skew, kurtosis
+
+sns.set_style('darkgrid')
+
+
+def _logsums(S, R, log):
+    '''
+    (assets x time) positions and position returns -> flat starts, inclusive ends
+    of the trades and the cumulative log returns, a zero column first
+    '''
+    prev = np.zeros_like(S)
+    prev[:, 1:] = S[:, :-1]
+    nxt = np.zeros_like(S)
+    nxt[:, :-1] = S[:, 1:]
+    # run-length encoding: a trade starts where a nonzero position changes and ends before the next change
+    starts = np.flatnonzero((S != 0) & (S != prev))
+    ends = np.flatnonzero((S != 0) & (S != nxt))
+    
+    C = np.zeros((S.shape[0], S.shape[1] + 1))
+    C[:, 1:] = np.cumsum(R if log else np.log1p(R), axis = 1)
+    
+    return starts, ends, C
+
+
+def _panel(signals, returns):
+    frame = lambda x: x.to_frame() if isinstance(x, pd.Series) else x
+    signals = frame(signals)
+    returns = frame(returns).reindex(index = signals.index)
+    returns.columns = signals.columns
+    S = np.nan_to_num(signals.to_numpy(dtype = np.float64).T)
+    R = np.nan_to_num(returns.to_numpy(dtype = np.float64).T)
+    
+    return signals, S, R
+
+
+def trade_table(signals, returns, log = False):
+    '''
+    Every trade of the signals, for one ticker or a panel of tickers at once
+
+    Parameters
+    ----------
+    signals : pandas series or dataframe
+        positions composed of only 1, 0, -1, (time x tickers) for a panel
+    returns : pandas series or dataframe
+        returns of the positions, e.g. signals_return, missing values are flat
+    log : Boolen
+        whether the returns are log returns
+
+    Returns
+    -------
+    pandas dataframe
+        type, exit, bars, compounded return and number of each trade,
+        indexed by entry, or (ticker, entry) for a panel
+
+    '''
+    panel = isinstance(signals, pd.DataFrame)
+    signals, S, R = _panel(signals, returns)
+    T = S.shape[1]
+    starts, ends, C = _logsums(S, R, log)
+    rows, entry, exit_ = starts // T, starts % T, ends % T
+    
+    ret = C[rows, exit_ + 1] - C[rows, entry]
+    first = np.searchsorted(rows, rows)
+    details = pd.DataFrame({'type': S.ravel()[starts], 
+                            'exit': signals.index[exit_],
+                            'bars': exit_ - entry + 1,
+                            'return': ret if log else np.expm1(ret),
+                            'number': np.arange(len(starts)) - first + 1},
+                           index = pd.MultiIndex.from_arrays([signals.columns[rows], signals.index[entry]]))
+    
+    return details if panel else details.droplevel(0)
+
+
+def holding_returns(signals, returns, periods, log = False):
+    '''
+    Returns over the bars following every trade entry, for all holding periods in one pass
+
+    Parameters
+    ----------
+    signals : pandas series or dataframe
+        same as trade_table
+    returns : pandas series or dataframe
+        same as trade_table
+    periods : list of int
+        holding periods in bars
+    log : Boolen
+        whether the returns are log returns
+
+    Returns
+    -------
+    pandas dataframe
+        (trades x periods), nan when the period runs past the data
+
+    '''
+    panel = isinstance(signals, pd.DataFrame)
+    signals, S, R = _panel(signals, returns)
+    T = S.shape[1]
+    starts, _, C = _logsums(S, R, log)
+    rows, entry = starts // T, starts % T
+    
+    periods = np.asarray(periods)
+    stop = entry[:, None] + periods[None, :]
+    valid = stop < T
+    H = C[rows[:, None], np.minimum(stop, T - 1) + 1] - C[rows, entry + 1][:, None]
+    H = np.where(valid, H if log else np.expm1(H), np.nan)
+    
+    out = pd.DataFrame(H, columns = periods,
+                       index = pd.MultiIndex.from_arrays([signals.columns[rows], signals.index[entry]]))
+    
+    return out if panel else out.droplevel(0)
+
+
+def trade_summary(details):
+    '''
+    Mean, median, stddev, skewness and kurtosis of the trade returns per type,
+    columns short and long, (ticker, short/long) for a panel
+    '''
+    side = details['type'].map({-1: 'short', 1: 'long'}).to_numpy()
+    keys = [side] if details.index.nlevels == 1 else [details.index.get_level_values(0), side]
+    g = details['return'].groupby(keys)
+    stats = pd.DataFrame({'mean': g.mean(), 'median': g.median(), 'stddev': g.std(),
+                          'skewness': g.agg(skew), 'kurtosis': g.agg(kurtosis)}).T
+    
+    return stats.reindex(columns = ['short', 'long']) if details.index.nlevels == 1 else stats
+
+
+class TestIndicators:
+    def __init__(self, ticker, **kwargs):
+        '''
+        Initialize the class
+        '''
+        # set up parameters for the indicator
+        self.params = {}
+        self.params.update(kwargs)
+        # test on single ticker
+        assert type(ticker) == str, 'Wrong Type of Ticker.'
+        self.ticker = ticker
+        self.data = None
+        self.indicator = None
+        self.signals = None
+        self.returns = None
+    
+    def read_data(self, interval, start_date, end_date):
+        '''
+        get data from Yahoo! Finance
+        '''
+        # only needed here, the trade statistics also run on local bars
+        import yfinance as yf
+        
+        tic = yf.Ticker(self.ticker)
+        data = tic.history(interval, start_date, end_date)
+        
+        return data
+    
+    def indicator_series(self):
+        '''
+        Over write this function to generate indicator series
+
+        Parameters
+        ----------
+        data : TYPE
+            DESCRIPTION.
+
+        Returns
+        -------
+        None.
+        
+
+        '''
+        return
+    
+    def indicator_signals(self, indicator):
+        '''
+        Generate signals for this indicator
+
+        Parameters
+        ----------
+        indicator : TYPE
+            DESCRIPTION.
+
+        Returns
+        -------
+        signals: pd.Series
+            composed of only 1, 0, -1
+
+        '''
+        
+        return
+    
+    def signals_return(self, signals, start, end, mid = False, log = False):
+        '''
+        Calculate returns
+
+        Parameters
+        ----------
+        signals : TYPE
+            DESCRIPTION.
+        log: Boolen
+            whether to calculate log return
+        mid : Boolen
+            whether to use mid price of the bar for return
+
+        Returns
+        -------
+        r: pd.Series
+            the return series
+        
+        '''
+        if self.data is None:
+            return 'No data to calculate.'
+        
+        if mid:
+            use_data = self.data.close.add(self.data.open).div(2)
+        else:
+            use_data = self.data.close
+            
+        if log:
+            r = np.log(use_data).diff().loc[start:end]
+        else:
+            r = use_data.pct_change().loc[start:end]
+            
+        r = signals.loc[start:end].mul(r)
+        self.returns = r
+        
+        return r
+    
+    def trades_stats(self, start, end, mid = False, log = False):
+        '''
+        Calculate trades statistics
+
+        Returns
+        -------
+        statistics of trades
+
+        '''
+        if self.signals is None:
+            return 'No signals.'
+        
+        recalculate = False
+        if self.returns is None:
+            recalculate = True
+        elif (self.returns.index[0].strftime("%Y-%m-%d")!=start) | (self.returns.index[-1].strftime("%Y-%m-%d")!=end):
+            recalculate = True
+            
+        if recalculate:
+            self.signals_return(self.signals, start, end, mid = mid, log = log)
+            
+        signals = self.signals.loc[start:end]
+        trades_detail = trade_table(signals, self.returns, log = log)
+        
+        # entry of the trade each bar belongs to
+        trades = signals.to_frame(name = 'trades')
+        trades['label'] = pd.Series(trades_detail.index, index = trades_detail.index).reindex(signals.index).ffill()
+        trades.loc[signals.fillna(0) == 0, 'label'] = pd.NaT
+        trades['return'] = self.returns
+        
+        return {'statistics': trade_summary(trades_detail), 
+                'details': trades_detail,
+                'time_series': trades}
+    
+    def return_distribution(self, start, end, mid = False, log = False):
+        '''
+        Visulize the distribution of return for each hypothetical trade
+        
+        start:
+            start of the testing period
+        end:
+            end of the testing period
+        Returns
+        -------
+        statistics of trades 
+
+        '''
+        trade_stats = self.trades_stats(start, end, mid, log)
+        stats = trade_stats['statistics']
+        
+        fig, ax = plt.subplots(figsize = (20, 10))
+        sns.histplot(x = 'return', hue = 'type', data = trade_stats['details'], ax = ax)
+        ax.set_title('Return distribution per trades', fontsize = 15)
+        
+        return stats
+    
+    def return_beanplot(self, periods, start, end, mid = False, log = False):
+        '''
+        Visuzlize the return distribution
+        with different holding periods
+
+        Returns
+        -------
+        all_returns: pd.DataFrame
+            type, period and return after every entry
+
+        '''
+        details = self.trades_stats(start, end, mid, log)['details']
+        
+        all_returns = holding_returns(self.signals.loc[start:end], self.returns, periods, log = log)
+        all_returns['type'] = details['type']
+        all_returns = all_returns.melt(id_vars = 'type', var_name = 'period', value_name = 'return')
+            
+        fig, ax = plt.subplots(figsize = (20, 10))
+        sns.violinplot(x = 'period', y = 'return', hue = 'type', data = all_returns, ax = ax)
+        ax.set_title('Return distribution in periods')
+        
+        return all_returns